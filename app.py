@@ -1,11 +1,11 @@
 from __future__ import annotations
 
-import io
 import os
 import sys
-import tempfile
+import time
+import uuid
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 import streamlit as st
 from dotenv import load_dotenv
@@ -15,7 +15,7 @@ PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
-from src.orchestrator import process_file  # noqa: E402
+from src.jobs import ACTIVE_STATUSES, JobRunner, JobStore, default_jobs_dir, format_ts, job_throughput  # noqa: E402
 
 # Load .env to populate Azure OpenAI settings for LLM calls
 load_dotenv()
@@ -29,15 +29,43 @@ st.markdown("""
 with st.sidebar:
     st.header("Instructions")
     st.markdown("""
-    - Upload an Excel file with a comment text column.
-    - Click Run to process redactions and themes.
-    - When done, click Open to view the output Excel.
+    - Upload an Excel file with a comment text column, or turn on Batch to upload a folder of them.
+    - Click Run to queue it for redaction and theme processing.
+    - Jobs run in the background: progress, partial results, cancel and resume are below.
+    - When done, download the output or click Open to view it.
     """)
 
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    """Return the single job runner (and shared, pre-warmed worker pool) for this Streamlit server."""
+    store = JobStore(os.path.join(default_jobs_dir(), "jobs.sqlite"))
+    max_workers = int(os.getenv("JOB_MAX_WORKERS", "0") or 0) or None
+    warm = os.getenv("JOB_WARM_POOL", "1").lower() not in ("0", "false", "no")
+    return JobRunner(store, max_workers=max_workers, warm=warm).start()
+
+
+runner = get_job_runner()
+store = runner.store
+
 # Inputs
-uploaded = st.file_uploader("Select input Excel (.xlsx)", type=["xlsx"], accept_multiple_files=False)
+batch_mode = st.toggle(
+    "Batch: process a folder of workbooks as one run",
+    help="Writes one output per workbook plus a combined dataset for clustering",
+)
+if batch_mode:
+    uploaded_files = st.file_uploader(
+        "Select a folder of input Excel files (.xlsx)", type=["xlsx"], accept_multiple_files="directory"
+    ) or []
+    uploaded = None
+else:
+    uploaded = st.file_uploader("Select input Excel (.xlsx)", type=["xlsx"], accept_multiple_files=False)
+    uploaded_files = []
 text_column = st.text_input("Enter comment text column name here:", value="comment")
-processes_val = st.number_input("[Technical] Worker processes (0 = auto)", min_value=0, max_value=64, value=0, step=1)
+processes_val = st.number_input(
+    "[Technical] Max worker processes for this job (0 = all shared workers)",
+    min_value=0, max_value=64, value=0, step=1,
+)
 
 # Default output path inside project data/ directory
 default_output_dir = os.path.join(PROJECT_ROOT, "data")
@@ -49,8 +77,16 @@ def _suggest_output_name(name: str) -> str:
         ext = ".xlsx"
     return f"{base}_processed{ext}"
 
+def _upload_parts(name: str) -> List[str]:
+    """Safe relative path components of an uploaded file's name (folder uploads keep subfolders)."""
+    return [p for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+
 if uploaded is not None:
     suggested = _suggest_output_name(uploaded.name)
+elif uploaded_files:
+    parts = _upload_parts(uploaded_files[0].name)
+    folder = parts[0] if len(parts) > 1 else "batch"
+    suggested = _suggest_output_name(f"{folder}_combined.xlsx")
 else:
     suggested = "comment_processing_results.xlsx"
 
@@ -62,43 +98,104 @@ st.caption(f"Will save as: {proposed_output_path}")
 
 run_clicked = st.button("Run")
 
-# Keep state of last output path to show Open button
-if "last_output_path" not in st.session_state:
-    st.session_state["last_output_path"] = None
-
 if run_clicked:
-    if uploaded is None:
+    if batch_mode and not uploaded_files:
+        st.error("Please upload a folder of input Excel files.")
+    elif not batch_mode and uploaded is None:
         st.error("Please upload an input Excel file.")
     else:
-        # Write uploaded file to a temp path on disk
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
-            tmp.write(uploaded.getbuffer())
-            tmp_input_path = tmp.name
-
-        st.info("Processing... this may take a few minutes depending on file size.")
-        try:
-            # Ensure output directory exists
-            target_dir = output_dir or default_output_dir
-            os.makedirs(target_dir, exist_ok=True)
-            processes: Optional[int] = None if processes_val == 0 else int(processes_val)
-            n, out_path = process_file(
-                input_path=tmp_input_path,
-                output_path=os.path.join(target_dir, suggested),
-                text_column=text_column,
-                processes=processes,
-            )
-            st.success(f"Processed {n} rows -> {out_path}")
-            st.session_state["last_output_path"] = out_path
-        except Exception as e:
-            st.exception(e)
-        finally:
-            try:
-                os.remove(tmp_input_path)
-            except Exception:
-                pass
-
-# Show Open button if the output exists
-out_path = st.session_state.get("last_output_path") or proposed_output_path
+        # Copy the upload into the jobs directory so it outlives this script run
+        target_dir = output_dir or default_output_dir
+        os.makedirs(target_dir, exist_ok=True)
+        processes: Optional[int] = None if processes_val == 0 else int(processes_val)
+        job_id = uuid.uuid4().hex[:12]
+        if batch_mode:
+            # A batch job's input is a directory; its files are processed as one run
+            job_input = os.path.join(default_jobs_dir(), job_id, "inputs")
+            for upload in uploaded_files:
+                dest = os.path.join(job_input, *_upload_parts(upload.name))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                with open(dest, "wb") as f:
+                    f.write(upload.getbuffer())
+            input_name = f"{len(uploaded_files)} files"
+        else:
+            job_input = os.path.join(default_jobs_dir(), job_id, "input.xlsx")
+            os.makedirs(os.path.dirname(job_input), exist_ok=True)
+            with open(job_input, "wb") as f:
+                f.write(uploaded.getbuffer())
+            input_name = uploaded.name
+        store.submit(
+            input_path=job_input,
+            output_path=os.path.join(target_dir, suggested),
+            text_column=text_column,
+            processes=processes,
+            input_name=input_name,
+            job_id=job_id,
+        )
+        st.success(f"Queued job {job_id} for {input_name}")
+
+
+def _render_job(job: Dict[str, Any]) -> None:
+    """Show one job's status, live progress and actions."""
+    job_id = job["id"]
+    stats = job_throughput(job)
+    with st.container(border=True):
+        head, actions = st.columns([3, 2])
+        with head:
+            st.markdown(f"**{job['input_name']}** · `{job_id}` · {job['status']}")
+            total = job["rows_total"] or 0
+            caption = f"{job['rows_done']}/{total or '?'} rows"
+            if job["rows_failed"]:
+                caption += f" ({job['rows_failed']} failed)"
+            if stats["rate"]:
+                caption += f" · {stats['rate']:.2f} rows/s"
+            if stats["eta"]:
+                caption += f" · ~{int(stats['eta'])}s left"
+            caption += f" · queued {format_ts(job['created_at'])}"
+            st.progress(min(1.0, stats["pct"] or 0.0), text=caption)
+            if job["error"]:
+                st.error(job["error"])
+        with actions:
+            if job["status"] in ACTIVE_STATUSES and st.button("Cancel", key=f"cancel_{job_id}"):
+                store.request_cancel(job_id)
+                st.rerun()
+            if job["status"] in ("cancelled", "failed") and st.button("Resume", key=f"resume_{job_id}"):
+                store.resume(job_id)
+                st.rerun()
+            if job["status"] == "done" and job["rows_failed"] and st.button(
+                "Retry failed rows", key=f"retry_{job_id}"
+            ):
+                store.resume(job_id)
+                st.rerun()
+            if job["status"] == "done" and job["result_path"] and os.path.exists(job["result_path"]):
+                with open(job["result_path"], "rb") as f:
+                    st.download_button(
+                        "Download results", f.read(), file_name=os.path.basename(job["result_path"]),
+                        key=f"dl_{job_id}",
+                    )
+            elif job["rows_done"]:
+                partial_key = f"partial_{job_id}"
+                if st.button("Prepare partial results", key=f"prep_{job_id}"):
+                    st.session_state[partial_key] = store.partial_output(job_id)
+                if partial_key in st.session_state:
+                    base, _ = os.path.splitext(job["input_name"] or "results.xlsx")
+                    st.download_button(
+                        "Download partial results", st.session_state[partial_key],
+                        file_name=f"{base}_partial.xlsx", key=f"dlp_{job_id}",
+                    )
+
+
+st.subheader("Jobs")
+live = st.checkbox("Live updates", value=True)
+jobs = store.list_jobs(limit=20)
+if not jobs:
+    st.caption("No jobs yet.")
+for job in jobs:
+    _render_job(job)
+
+# Show Open button for the newest finished output (or the proposed path if it exists)
+latest_done = next((j["result_path"] for j in jobs if j["status"] == "done" and j["result_path"]), None)
+out_path = latest_done or proposed_output_path
 if out_path and os.path.exists(out_path):
     col1, col2 = st.columns([1, 3])
     with col1:
@@ -114,3 +211,8 @@ if out_path and os.path.exists(out_path):
                 st.error(f"Failed to open file: {e}")
     with col2:
         st.caption(f"Last updated: {datetime.fromtimestamp(os.path.getmtime(out_path)).strftime('%Y-%m-%d %H:%M:%S')}")
+
+# Poll while anything is queued or running; the work itself continues in the runner thread
+if live and any(j["status"] in ACTIVE_STATUSES for j in jobs):
+    time.sleep(2)
+    st.rerun()
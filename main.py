@@ -1,26 +1,61 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
 import os
+from typing import Any
 
 from src.utils.logging import get_logger
-from src.orchestrator import process_file
 
 
 logger = get_logger(__name__)
 
 
+def _maybe_serve_metrics(args: argparse.Namespace) -> None:
+    """Start the Prometheus-style metrics endpoint when --metrics-port (or METRICS_PORT) is set."""
+    port = args.metrics_port or int(os.getenv("METRICS_PORT", "0") or 0)
+    if port:
+        from src.utils.metrics import start_metrics_server
+        start_metrics_server(port)
+
+
+def _profiler(args: argparse.Namespace) -> Any:
+    """Return a run profiler context when --profile is set, else a no-op context."""
+    if not args.profile:
+        return contextlib.nullcontext()
+    from src.utils.profiling import RunProfiler
+    return RunProfiler(args.output, top_n=args.profile_top)
+
+
 def cmd_process(args: argparse.Namespace) -> None:
     """Run Task One & Two over the input Excel and write results to output Excel."""
-    n, out = process_file(
-        input_path=args.input,
-        output_path=args.output,
-        text_column=args.text_column,
-        uid_column=args.uid_column,
-        name_column=args.name_column,
-        date_column=args.date_column,
-        processes=args.processes,
-    )
+    # Heavy imports (pandas, SDK) are deferred so `--help` and argument errors return instantly
+    from src.orchestrator import expand_inputs, process_file, process_files
+    _maybe_serve_metrics(args)
+    if args.input_glob:
+        paths = expand_inputs(args.input_glob, output_path=args.output)
+        logger.info("Processing %s files matching %s", len(paths), args.input_glob)
+        with _profiler(args) as prof:
+            n, out = process_files(
+                input_paths=paths,
+                output_path=args.output,
+                text_column=args.text_column,
+                processes=args.processes,
+                profile_dir=getattr(prof, "worker_dir", None),
+            )
+        logger.info("Processed %s rows from %s files -> %s", n, len(paths), out)
+        return
+    with _profiler(args) as prof:
+        n, out = process_file(
+            input_path=args.input,
+            output_path=args.output,
+            text_column=args.text_column,
+            uid_column=args.uid_column,
+            name_column=args.name_column,
+            date_column=args.date_column,
+            processes=args.processes,
+            profile_dir=getattr(prof, "worker_dir", None),
+        )
     logger.info("Processed %s rows -> %s", n, out)
 
 
@@ -28,13 +63,66 @@ def cmd_cluster(args: argparse.Namespace) -> None:
     """Cluster themes from a processed results spreadsheet into labeled groups."""
     # Lazy import to avoid importing clustering when disabled
     from src.comment_theme_clusterer import cluster_themes
-    n, out = cluster_themes(
+    _maybe_serve_metrics(args)
+    with _profiler(args):
+        n, out = cluster_themes(
+            input_path=args.input,
+            output_path=args.output,
+            themes_column=args.themes_column,
+            min_cluster_size=args.min_cluster_size,
+            llm_labels=not args.no_llm_labels,
+            label_batch_size=args.label_batch_size,
+            label_cache_path=args.label_cache,
+        )
+    logger.info("Produced %s clusters -> %s", n, out)
+
+
+def cmd_recut(args: argparse.Namespace) -> None:
+    """Re-cut a cached condensed tree at new granularities without refitting or re-embedding."""
+    from src.comment_theme_clusterer import recut_clusters
+    n, out = recut_clusters(
+        tree_path=args.tree,
+        output_path=args.output,
+        min_cluster_sizes=args.min_cluster_size,
+        llm_labels=args.llm_labels,
+        label_cache_path=args.label_cache,
+    )
+    logger.info("Produced %s clusters at the finest level -> %s", n, out)
+
+
+def cmd_coordinate(args: argparse.Namespace) -> None:
+    """Shard the input into the work queue, wait for workers and merge their results."""
+    from src.work_queue import coordinate, default_queue_path
+    _maybe_serve_metrics(args)
+    n, out = coordinate(
         input_path=args.input,
         output_path=args.output,
-        themes_column=args.themes_column,
-        min_cluster_size=args.min_cluster_size,
+        text_column=args.text_column,
+        queue_path=args.queue or default_queue_path(),
+        shard_size=args.shard_size,
+        lease_seconds=args.lease_seconds,
+        max_attempts=args.max_attempts,
+        run_id=args.run_id,
     )
-    logger.info("Produced %s clusters -> %s", n, out)
+    logger.info("Merged %s rows -> %s", n, out)
+
+
+def cmd_worker(args: argparse.Namespace) -> None:
+    """Lease shards from the work queue and process them until stopped."""
+    from src.work_queue import default_queue_path, run_worker
+    n = run_worker(
+        queue_path=args.queue or default_queue_path(),
+        run_id=args.run_id,
+        processes=args.processes,
+        exit_when_idle=args.exit_when_idle,
+    )
+    logger.info("Worker completed %s shards", n)
+
+
+def _add_profile_args(p: argparse.ArgumentParser) -> None:
+    """Add the --profile/--profile-top options shared by process and cluster."""
+    p.add_argument("--profile", action="store_true", help="Write cProfile + tracemalloc artifacts next to the output")
+    p.add_argument("--profile-top", type=int, default=25, help="Hot spots to print with --profile")
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -43,15 +131,44 @@ def build_parser() -> argparse.ArgumentParser:
     sub = p.add_subparsers(dest="command", required=True)
 
     p_proc = sub.add_parser("process", help="Process comments (Task One & Two)")
-    p_proc.add_argument("--input", required=True, help="Path to input Excel file")
-    p_proc.add_argument("--output", required=True, help="Path to output Excel file")
+    p_in = p_proc.add_mutually_exclusive_group(required=True)
+    p_in.add_argument("--input", help="Path to input Excel file")
+    p_in.add_argument(
+        "--input-glob",
+        help="Glob pattern (quote it) or directory of input Excel files to process as one run",
+    )
+    p_proc.add_argument(
+        "--output", required=True,
+        help="Path to output Excel file (with --input-glob: the combined dataset; per-file outputs go beside it)",
+    )
     p_proc.add_argument("--text-column", default="comment", help="Name of the text column in input Excel")
     p_proc.add_argument("--uid-column", default=None)
     p_proc.add_argument("--name-column", default=None)
     p_proc.add_argument("--date-column", default=None)
     p_proc.add_argument("--processes", type=int, default=None, help="Max worker processes")
+    p_proc.add_argument("--metrics-port", type=int, default=None, help="Serve live metrics on this local port")
+    _add_profile_args(p_proc)
     p_proc.set_defaults(func=cmd_process)
 
+    p_coord = sub.add_parser("coordinate", help="Shard comments into a work queue for 'worker' processes")
+    p_coord.add_argument("--input", required=True, help="Path to input Excel file")
+    p_coord.add_argument("--output", required=True, help="Path to output Excel file")
+    p_coord.add_argument("--text-column", default="comment", help="Name of the text column in input Excel")
+    p_coord.add_argument("--queue", default=None, help="Queue SQLite file, e.g. on shared storage (WORK_QUEUE_PATH)")
+    p_coord.add_argument("--shard-size", type=int, default=200, help="Rows per shard")
+    p_coord.add_argument("--lease-seconds", type=float, default=300.0, help="Lease timeout before a shard is re-run")
+    p_coord.add_argument("--max-attempts", type=int, default=3, help="Leases per shard before its rows fail")
+    p_coord.add_argument("--run-id", default=None, help="Re-attach to an existing run instead of enqueueing")
+    p_coord.add_argument("--metrics-port", type=int, default=None, help="Serve live metrics on this local port")
+    p_coord.set_defaults(func=cmd_coordinate)
+
+    p_work = sub.add_parser("worker", help="Process shards from a work queue")
+    p_work.add_argument("--queue", default=None, help="Queue SQLite file (WORK_QUEUE_PATH)")
+    p_work.add_argument("--run-id", default=None, help="Only work on this run")
+    p_work.add_argument("--processes", type=int, default=None, help="Max worker processes on this machine")
+    p_work.add_argument("--exit-when-idle", action="store_true", help="Exit once no shards are available")
+    p_work.set_defaults(func=cmd_worker)
+
     # Clustering subcommand disabled by default. Set DISABLE_CLUSTER=0 to enable.
     disable_cluster = os.getenv("DISABLE_CLUSTER", "1").lower() in ("1", "true", "yes")
     if not disable_cluster:
@@ -60,8 +177,24 @@ def build_parser() -> argparse.ArgumentParser:
         p_clu.add_argument("--output", required=True, help="Path to theme clusters Excel file")
         p_clu.add_argument("--themes-column", default="themes", help="Name of the themes column in results Excel")
         p_clu.add_argument("--min-cluster-size", type=int, default=5)
+        p_clu.add_argument("--no-llm-labels", action="store_true", help="Label clusters by medoid theme only")
+        p_clu.add_argument("--label-batch-size", type=int, default=25, help="Clusters per LLM labeling call")
+        p_clu.add_argument("--label-cache", default=None, help="Path to cluster label cache JSON")
+        p_clu.add_argument("--metrics-port", type=int, default=None, help="Serve live metrics on this local port")
+        _add_profile_args(p_clu)
         p_clu.set_defaults(func=cmd_cluster)
 
+        p_cut = sub.add_parser("recut", help="Re-cut a cached cluster tree at other granularities")
+        p_cut.add_argument("--tree", required=True, help="Path to the .tree.npz written by 'cluster'")
+        p_cut.add_argument("--output", required=True, help="Path to theme clusters Excel file")
+        p_cut.add_argument(
+            "--min-cluster-size", type=int, nargs="+", required=True,
+            help="One size for a flat cut, or several (e.g. 40 10) for a topic -> subtopic hierarchy",
+        )
+        p_cut.add_argument("--llm-labels", action="store_true", help="Label clusters via the cached LLM labeler")
+        p_cut.add_argument("--label-cache", default=None, help="Path to cluster label cache JSON")
+        p_cut.set_defaults(func=cmd_recut)
+
     return p
 
 
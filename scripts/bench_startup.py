@@ -0,0 +1,100 @@
+"""Benchmark startup time of the CLI, the Streamlit app module and pool worker bootstrap.
+
+Each measurement runs in a fresh interpreter and is repeated; the median is reported.
+Pass `--history` to append the results to a JSON-lines file and track them over time.
+
+    python scripts/bench_startup.py --repeat 5 --history data/bench/startup.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_WORKER_BOOTSTRAP = """
+import multiprocessing, sys, time
+from concurrent.futures import ProcessPoolExecutor
+start = time.perf_counter()
+from src.orchestrator import _worker_init, warmup
+ctx = multiprocessing.get_context(sys.argv[1])
+with ProcessPoolExecutor(max_workers=1, mp_context=ctx, initializer=_worker_init) as ex:
+    ex.submit(warmup).result()
+    print(time.perf_counter() - start)
+"""
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = PROJECT_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env["JOB_WARM_POOL"] = "0"
+    env["JOBS_DIR"] = tempfile.mkdtemp(prefix="bench_jobs_")
+    # Clients are built (not called) during bootstrap; placeholders suffice when unset
+    env.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com")
+    env.setdefault("AZURE_OPENAI_API_KEY", "placeholder")
+    return env
+
+
+def _wall(cmd: List[str], env: Dict[str, str]) -> float:
+    """Wall time of a command in a fresh interpreter."""
+    start = time.perf_counter()
+    subprocess.run(cmd, cwd=PROJECT_ROOT, env=env, check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def _reported(cmd: List[str], env: Dict[str, str]) -> float:
+    """Seconds printed on the last stdout line of a command."""
+    out = subprocess.run(cmd, cwd=PROJECT_ROOT, env=env, check=True, capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def run(repeat: int) -> Dict[str, float]:
+    env = _env()
+    py = sys.executable
+    cases = {
+        "interpreter": lambda: _wall([py, "-c", "pass"], env),
+        "main_help": lambda: _wall([py, "main.py", "--help"], env),
+        "app_import": lambda: _wall([py, "-c", "import app"], env),
+    }
+    for method in ("fork", "spawn"):
+        if method in multiprocessing.get_all_start_methods():
+            cases[f"worker_bootstrap_{method}"] = lambda m=method: _reported([py, "-c", _WORKER_BOOTSTRAP, m], env)
+    return {name: statistics.median(fn() for _ in range(repeat)) for name, fn in cases.items()}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (median is reported)")
+    parser.add_argument("--history", default=None, help="Append results to this JSON-lines file")
+    args = parser.parse_args()
+
+    results = run(max(1, args.repeat))
+    width = max(len(k) for k in results)
+    for name, secs in results.items():
+        print(f"{name:<{width}}  {secs * 1000:8.1f} ms")
+
+    if args.history:
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        record = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "repeat": args.repeat,
+            "seconds": results,
+        }
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Any, Callable, Optional
+
+from src.utils.logging import get_logger
+from src.utils.metrics import metrics
+
+
+logger = get_logger(__name__)
+
+
+def cache_key(namespace: str, *parts: str) -> str:
+    """Hash a namespace plus text parts (e.g. prompt and comment) into a cache key."""
+    h = hashlib.sha256(namespace.encode("utf-8"))
+    for part in parts:
+        h.update(b"\x00")
+        h.update(part.encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Durable SQLite key/value cache for LLM task results, shared by all worker processes.
+
+    A connection is opened per operation, so the cache is safe to use from forked or
+    spawned workers and from several processes at once.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any) -> None:
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time()),
+            )
+
+
+_cache: Optional[ResultCache] = None
+
+
+def get_cache() -> Optional[ResultCache]:
+    """Return the process-wide result cache, or None when disabled with `RESULT_CACHE=0`.
+
+    The location comes from `RESULT_CACHE_PATH` (default `data/.cache/llm_results.sqlite`).
+    """
+    global _cache
+    if os.getenv("RESULT_CACHE", "1").lower() in ("0", "false", "no"):
+        return None
+    if _cache is None:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        path = os.getenv("RESULT_CACHE_PATH", os.path.join(root, "data", ".cache", "llm_results.sqlite"))
+        _cache = ResultCache(path)
+    return _cache
+
+
+def cached(namespace: str, parts: list, compute: Callable[[], Any], store_if: Callable[[Any], bool] = bool) -> Any:
+    """Return the cached value for `(namespace, *parts)`, computing and storing it on a miss.
+
+    Values for which `store_if` is false (by default empty results, e.g. after a parse
+    failure) are returned but not cached, so a later run tries again.
+    """
+    cache = get_cache()
+    if cache is None:
+        return compute()
+    key = cache_key(namespace, *parts)
+    try:
+        hit = cache.get(key)
+    except Exception as e:
+        logger.warning("Result cache read failed: %s", e)
+        hit = None
+    if hit is not None:
+        metrics.inc("cache_hits_total", namespace=namespace)
+        return hit
+    metrics.inc("cache_misses_total", namespace=namespace)
+    value = compute()
+    if store_if(value):
+        try:
+            cache.set(key, value)
+        except Exception as e:
+            logger.warning("Result cache write failed: %s", e)
+    return value
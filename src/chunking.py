@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import List
+
+from src.scheduling import CHARS_PER_TOKEN, estimate_tokens
+
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def chunk_limits() -> tuple:
+    """Return `(chunk_tokens, overlap_tokens)` from `CHUNK_TOKENS` / `CHUNK_OVERLAP_TOKENS`."""
+    chunk_tokens = int(os.getenv("CHUNK_TOKENS", "3000") or 3000)
+    overlap_tokens = int(os.getenv("CHUNK_OVERLAP_TOKENS", "200") or 200)
+    return max(1, chunk_tokens), max(0, overlap_tokens)
+
+
+def _pieces(text: str, max_tokens: int) -> List[str]:
+    """Split text into paragraphs, breaking any oversized paragraph by sentence, then by length."""
+    out: List[str] = []
+    for para in _PARAGRAPH_BREAK.split(text):
+        para = para.strip()
+        if not para:
+            continue
+        if estimate_tokens(para) <= max_tokens:
+            out.append(para)
+            continue
+        limit = max_tokens * CHARS_PER_TOKEN
+        for sent in _SENTENCE_END.split(para):
+            out.extend(sent[i:i + limit] for i in range(0, len(sent), limit) if sent[i:i + limit].strip())
+    return out
+
+
+def split_comment(text: str, max_tokens: int, overlap_tokens: int = 0) -> List[str]:
+    """Split a long comment into chunks of at most ~`max_tokens` on paragraph boundaries.
+
+    Consecutive chunks share up to `overlap_tokens` of trailing paragraphs so quotes and
+    themes that straddle a boundary are seen whole by at least one chunk. Comments that
+    already fit, or have no text to split (e.g. only whitespace), are returned as a single
+    chunk, unchanged.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for piece in _pieces(text, max_tokens):
+        n = estimate_tokens(piece)
+        if current and size + n > max_tokens:
+            chunks.append("\n\n".join(current))
+            # Carry trailing paragraphs forward as overlap
+            carry: List[str] = []
+            carried = 0
+            for prev in reversed(current):
+                m = estimate_tokens(prev)
+                if carried + m > overlap_tokens or carried + m + n > max_tokens:
+                    break
+                carry.insert(0, prev)
+                carried += m
+            current, size = carry, carried
+        current.append(piece)
+        size += n
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks or [text]
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.llm.azure_openai_client import chat_json
+from src.llm.schemas import CLUSTER_LABELS_SCHEMA
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def _load_prompt() -> str:
+    """Load the cluster labeling system prompt from `src/prompts/cluster_label_prompt.txt`."""
+    prompt_path = Path(__file__).resolve().parent / "prompts" / "cluster_label_prompt.txt"
+    return prompt_path.read_text(encoding="utf-8")
+
+
+def membership_hash(members: List[str]) -> str:
+    """Return a stable hash of a cluster's member themes (order-insensitive)."""
+    h = hashlib.sha1()
+    for m in sorted(members):
+        h.update(m.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def _load_cache(path: Optional[str]) -> Dict[str, str]:
+    """Read the label cache JSON (`{cache_key: label}`); missing or unreadable files yield {}."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {str(k): str(v) for k, v in data.items()} if isinstance(data, dict) else {}
+    except Exception as e:
+        logger.warning("Ignoring unreadable label cache %s: %s", path, e)
+        return {}
+
+
+def _save_cache(path: Optional[str], cache: Dict[str, str]) -> None:
+    """Atomically write the label cache JSON."""
+    if not path:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=0, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _label_batch(batch: List[Dict[str, Any]], system: str) -> Dict[int, str]:
+    """Label one batch of clusters with a single `chat_json` call."""
+    payload = [{"id": int(c["cluster_id"]), "examples": list(c["samples"])} for c in batch]
+    messages = [
+        {
+            "role": "user",
+            "content": f"Clusters:\n{json.dumps(payload, ensure_ascii=False)}\n\nReturn ONLY the JSON as specified.",
+        }
+    ]
+    raw = chat_json(messages, system=system, max_tokens=100 + 24 * len(batch), schema=CLUSTER_LABELS_SCHEMA)
+    items = raw.get("labels", []) if isinstance(raw, dict) else []
+    out: Dict[int, str] = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            cid = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        label = str(item.get("label", "")).strip()
+        if label:
+            out[cid] = label
+    return out
+
+
+def label_clusters(
+    clusters: List[Dict[str, Any]],
+    cache_path: Optional[str] = None,
+    batch_size: int = 25,
+    max_workers: int = 4,
+) -> Dict[int, str]:
+    """Generate human-readable labels for clusters using batched, cached LLM calls.
+
+    Args:
+        clusters: Items with `cluster_id`, `member_hash` and `samples` (exemplar themes,
+            most representative first).
+        cache_path: JSON file mapping membership hashes to labels. Clusters whose
+            membership is unchanged since a previous run reuse their cached label.
+        batch_size: Number of clusters packed into each LLM call.
+        max_workers: Concurrent labeling calls.
+
+    Returns:
+        Mapping of cluster_id -> label for every cluster that could be labeled. Clusters
+        missing from the result should fall back to their medoid theme.
+    """
+    if not clusters:
+        return {}
+    system = _load_prompt()
+    # Tie cache entries to the prompt so prompt edits invalidate old labels
+    prompt_tag = hashlib.sha1(system.encode("utf-8")).hexdigest()[:12]
+    cache = _load_cache(cache_path)
+
+    labels: Dict[int, str] = {}
+    todo: List[Dict[str, Any]] = []
+    for c in clusters:
+        key = f"{prompt_tag}:{c['member_hash']}"
+        if key in cache:
+            labels[int(c["cluster_id"])] = cache[key]
+        else:
+            todo.append(c)
+    logger.info("Cluster labels: %s cached, %s to generate", len(labels), len(todo))
+    if not todo:
+        return labels
+
+    batches = [todo[i:i + max(1, batch_size)] for i in range(0, len(todo), max(1, batch_size))]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as ex:
+        futures = [ex.submit(_label_batch, b, system) for b in batches]
+        for batch, fut in zip(batches, futures):
+            try:
+                generated = fut.result()
+            except Exception as e:
+                logger.warning("Cluster labeling batch failed (%s clusters): %s", len(batch), e)
+                continue
+            for c in batch:
+                cid = int(c["cluster_id"])
+                if cid in generated:
+                    labels[cid] = generated[cid]
+                    cache[f"{prompt_tag}:{c['member_hash']}"] = generated[cid]
+
+    _save_cache(cache_path, cache)
+    return labels
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def tree_cache_path(output_path: str) -> str:
+    """Return the condensed-tree cache path written alongside a cluster output file."""
+    base, _ = os.path.splitext(output_path)
+    return f"{base}.tree.npz"
+
+
+def save_tree(
+    path: str,
+    condensed_tree: np.ndarray,
+    themes: List[str],
+    X: np.ndarray,
+    occurrence_idx: np.ndarray,
+    comment_idx: np.ndarray,
+    min_cluster_size: int,
+) -> str:
+    """Persist an HDBSCAN condensed tree plus everything needed to re-cut and summarize it.
+
+    `condensed_tree` is the structured array from `HDBSCAN.condensed_tree_.to_numpy()`;
+    `themes`/`X` are the unique themes and their (scaled) embeddings and the index arrays
+    map theme occurrences back to themes and source comments.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.savez(
+        path,
+        parent=np.asarray(condensed_tree["parent"], dtype=np.int64),
+        child=np.asarray(condensed_tree["child"], dtype=np.int64),
+        lambda_val=np.asarray(condensed_tree["lambda_val"], dtype=np.float64),
+        child_size=np.asarray(condensed_tree["child_size"], dtype=np.int64),
+        themes=np.asarray(themes, dtype=str),
+        X=np.asarray(X, dtype=np.float32),
+        occurrence_idx=np.asarray(occurrence_idx, dtype=np.int64),
+        comment_idx=np.asarray(comment_idx, dtype=np.int64),
+        min_cluster_size=np.int64(min_cluster_size),
+    )
+    return path
+
+
+def load_tree(path: str) -> Dict[str, Any]:
+    """Load a tree cache written by `save_tree` into a plain dict of arrays."""
+    with np.load(path, allow_pickle=False) as data:
+        out: Dict[str, Any] = {k: data[k] for k in data.files}
+    out["themes"] = out["themes"].tolist()
+    out["min_cluster_size"] = int(out["min_cluster_size"])
+    return out
+
+
+def select_clusters(tree: Dict[str, Any], min_cluster_size: int) -> Tuple[np.ndarray, Dict[int, int]]:
+    """Re-condense the cached tree at `min_cluster_size` and select flat clusters by excess of mass.
+
+    Splits where a child is smaller than `min_cluster_size` are treated as points falling
+    out of the parent (as if HDBSCAN had been fit with that size and the same `min_samples`),
+    then the most stable non-overlapping clusters are selected. Sizes below the fitted size
+    cannot add detail that the condensed tree never recorded and are clamped to it.
+
+    Returns `(labels, nodes)`: per-point labels (-1 for noise, clusters numbered by tree
+    order) and a mapping of each selected label to its condensed-tree node id.
+    """
+    fit_size = int(tree.get("min_cluster_size", 1))
+    if min_cluster_size < fit_size:
+        logger.warning(
+            "min_cluster_size %s is below the fitted size %s; using %s", min_cluster_size, fit_size, fit_size
+        )
+        min_cluster_size = fit_size
+
+    parent = tree["parent"]
+    child = tree["child"]
+    lam = tree["lambda_val"]
+    child_size = tree["child_size"]
+    n_points = len(tree["themes"])
+    if len(parent) == 0:
+        return np.full(n_points, -1, dtype=np.int64), {}
+    root = int(parent.min())
+
+    # Cluster nodes are numbered root..max; index them relative to the root
+    is_cluster_row = child >= root
+    n_nodes = int(max(parent.max(), child[is_cluster_row].max() if is_cluster_row.any() else root)) - root + 1
+    birth = np.zeros(n_nodes)
+    size = np.zeros(n_nodes, dtype=np.int64)
+    size[0] = n_points
+    c_rows = np.flatnonzero(is_cluster_row)
+    birth[child[c_rows] - root] = lam[c_rows]
+    size[child[c_rows] - root] = child_size[c_rows]
+    children: List[List[int]] = [[] for _ in range(n_nodes)]
+    for p, c in zip((parent[c_rows] - root).tolist(), (child[c_rows] - root).tolist()):
+        children[p].append(c)
+
+    # Top-down re-condensation: owner = surviving node each node's points belong to,
+    # fall_lambda = lambda at which a pruned subtree leaves its owner (nan if not pruned)
+    owner = np.zeros(n_nodes, dtype=np.int64)
+    fall_lambda = np.full(n_nodes, np.nan)
+    pruned_top = np.zeros(n_nodes, dtype=bool)
+    real_parent = np.full(n_nodes, -1, dtype=np.int64)
+    is_real = np.zeros(n_nodes, dtype=bool)
+    is_real[0] = True
+    # Node ids grow with depth, so a forward pass visits parents before children
+    for node in range(n_nodes):
+        kids = children[node]
+        if not kids:
+            continue
+        if not np.isnan(fall_lambda[node]):
+            for k in kids:
+                owner[k] = owner[node]
+                fall_lambda[k] = fall_lambda[node]
+            continue
+        surviving = [k for k in kids if size[k] >= min_cluster_size]
+        for k in kids:
+            if len(surviving) >= 2 and k in surviving:
+                owner[k] = k
+                is_real[k] = True
+                real_parent[k] = owner[node]
+            elif k in surviving:
+                # A lone survivor is the parent cluster continuing, not a split
+                owner[k] = owner[node]
+            else:
+                owner[k] = owner[node]
+                fall_lambda[k] = birth[k]
+                pruned_top[k] = True
+
+    # Per-point owner and exit lambda
+    p_rows = np.flatnonzero(~is_cluster_row)
+    p_node = parent[p_rows] - root
+    p_owner = owner[p_node]
+    p_fall = fall_lambda[p_node]
+    p_lambda = np.where(np.isnan(p_fall), lam[p_rows], p_fall)
+    # Exact duplicates leave at infinite lambda; cap them at the largest finite value
+    finite = np.isfinite(p_lambda)
+    if not finite.all():
+        p_lambda = np.where(finite, p_lambda, p_lambda[finite].max() if finite.any() else 0.0)
+
+    # A surviving cluster dissolves as soon as departures shrink it below min_cluster_size:
+    # everything still inside leaves at that lambda. Departures are single points leaving
+    # the cluster and pruned subtrees leaving at their birth.
+    own = np.isnan(p_fall)
+    tops = np.flatnonzero(pruned_top)
+    ev_owner = np.concatenate([p_owner[own], owner[tops]])
+    ev_lambda = np.concatenate([p_lambda[own], birth[tops]])
+    ev_count = np.concatenate([np.ones(int(own.sum()), dtype=np.int64), size[tops]])
+    ev_order = np.lexsort((ev_lambda, ev_owner))
+    ev_owner, ev_lambda, ev_count = ev_owner[ev_order], ev_lambda[ev_order], ev_count[ev_order]
+    seg_start = np.flatnonzero(np.r_[True, ev_owner[1:] != ev_owner[:-1]]) if len(ev_owner) else np.empty(0, int)
+    csum = np.cumsum(ev_count)
+    departed = csum - np.repeat(csum[seg_start] - ev_count[seg_start], np.diff(np.r_[seg_start, len(csum)]))
+    remaining = size[ev_owner] - departed
+    dissolve = np.full(n_nodes, np.inf)
+    hits = remaining < min_cluster_size
+    np.minimum.at(dissolve, ev_owner[hits], ev_lambda[hits])
+    p_lambda = np.minimum(p_lambda, dissolve[p_owner])
+
+    # Stability = sum over members of (exit lambda - birth) including real child clusters
+    stability = np.bincount(p_owner, weights=p_lambda - birth[p_owner], minlength=n_nodes)
+    real_nodes = np.flatnonzero(is_real)
+    for node in real_nodes.tolist():
+        if node != 0:
+            stability[real_parent[node]] += size[node] * (birth[node] - birth[real_parent[node]])
+
+    # Excess-of-mass selection, bottom-up; the root is never selected
+    real_children: Dict[int, List[int]] = {int(n): [] for n in real_nodes}
+    for node in real_nodes.tolist():
+        if node != 0:
+            real_children[int(real_parent[node])].append(node)
+    selected = np.zeros(n_nodes, dtype=bool)
+    best = stability.copy()
+    for node in real_nodes[::-1].tolist():
+        if node == 0:
+            continue
+        sub = sum(best[k] for k in real_children[node])
+        if real_children[node] and sub > stability[node]:
+            best[node] = sub
+        else:
+            selected[node] = True
+            stack = list(real_children[node])
+            while stack:
+                k = stack.pop()
+                selected[k] = False
+                stack.extend(real_children[k])
+
+    # Each real node maps to its nearest selected ancestor-or-self (root -> noise)
+    sel_nodes = np.flatnonzero(selected)
+    node_label = np.full(n_nodes, -1, dtype=np.int64)
+    node_label[sel_nodes] = np.arange(len(sel_nodes))
+    for node in real_nodes.tolist():
+        if node != 0 and node_label[node] == -1:
+            node_label[node] = node_label[real_parent[node]]
+
+    labels = np.full(n_points, -1, dtype=np.int64)
+    labels[child[p_rows]] = node_label[p_owner]
+    return labels, {int(i): int(n) + root for i, n in enumerate(sel_nodes)}
+
+
+def nest_levels(coarse: np.ndarray, fine: np.ndarray) -> Dict[int, int]:
+    """Map each fine cluster to the coarse cluster holding most of its points (-1 if none)."""
+    mask = fine >= 0
+    if not mask.any():
+        return {}
+    n_coarse = int(coarse.max()) + 2
+    keys = fine[mask] * n_coarse + (coarse[mask] + 1)
+    counts = np.bincount(keys, minlength=(int(fine.max()) + 1) * n_coarse).reshape(-1, n_coarse)
+    present = np.flatnonzero(counts.sum(axis=1))
+    return {int(f): int(counts[f].argmax()) - 1 for f in present}
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import json
+import os
 import re
-from typing import Any, Dict, List, Tuple
+import time
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
@@ -11,8 +14,11 @@ from sklearn.metrics import silhouette_score
 from sklearn.cluster import KMeans
 import hdbscan
 
+from src.cluster_labeler import label_clusters, membership_hash
+from src.cluster_tree import load_tree, nest_levels, save_tree, select_clusters, tree_cache_path
 from src.llm.azure_openai_client import embed_texts
 from src.utils.logging import get_logger
+from src.utils.metrics import metrics, write_run_report
 
 
 logger = get_logger(__name__)
@@ -23,7 +29,8 @@ def _parse_themes_cell(cell: Any) -> List[str]:
 
     Accepts JSON array strings, Python lists, or delimited strings; returns trimmed non-empty items.
     """
-    if cell is None:
+    # Blank cells (e.g. rows that failed processing) read back from Excel as NaN
+    if cell is None or (isinstance(cell, float) and np.isnan(cell)):
         return []
     if isinstance(cell, list):
         return [str(x).strip() for x in cell if str(x).strip()]
@@ -41,43 +48,121 @@ def _parse_themes_cell(cell: Any) -> List[str]:
     return [p for p in parts if p]
 
 
-def _summarize_clusters(themes: List[str], labels: np.ndarray, X: np.ndarray) -> pd.DataFrame:
-    """Build a compact summary dataframe for clusters with exemplar labels and counts."""
-    df = pd.DataFrame({"theme": themes, "cluster_id": labels})
-    rows = []
-    for cid in sorted(set(labels)):
-        if cid == -1:
-            # treat noise as its own bucket
-            mask = labels == -1
-            count = int(mask.sum())
-            if count == 0:
-                continue
-            sample = df[df.cluster_id == -1].theme.head(5).tolist()
-            rows.append({
+def _explode_themes(cells: List[Any]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Explode theme cells into unique themes plus per-occurrence index arrays.
+
+    Returns `(unique_themes, occurrence_idx, comment_idx)` where `occurrence_idx[i]` points
+    into the sorted `unique_themes` and `comment_idx[i]` is the source row of occurrence `i`.
+    """
+    per_row = [_parse_themes_cell(cell) for cell in cells]
+    lengths = np.fromiter((len(ts) for ts in per_row), dtype=np.int64, count=len(per_row))
+    comment_idx = np.repeat(np.arange(len(per_row), dtype=np.int64), lengths)
+    all_themes = [t for ts in per_row for t in ts]
+    if not all_themes:
+        return [], np.empty(0, dtype=np.int64), comment_idx
+    codes, uniques = pd.factorize(pd.Series(all_themes, dtype=object), sort=True)
+    return [str(u) for u in uniques], codes.astype(np.int64), comment_idx
+
+
+def _segment_medoids(labels: np.ndarray, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Compute per-cluster medoids for all clusters in one pass over label-sorted rows.
+
+    Returns `(cluster_ids, starts, sizes, ranked)`. `ranked` holds row indices grouped by
+    cluster (in `cluster_ids` order, segment `k` spanning `starts[k]:starts[k] + sizes[k]`)
+    and ordered by distance to the cluster centroid, so `ranked[starts]` are the medoids.
+    """
+    order = np.argsort(labels, kind="stable")
+    cluster_ids, starts, sizes = np.unique(labels[order], return_index=True, return_counts=True)
+    X_sorted = X[order]
+    centroids = np.add.reduceat(X_sorted, starts, axis=0) / sizes[:, None]
+    seg = np.repeat(np.arange(len(cluster_ids)), sizes)
+    diff = X_sorted - centroids[seg]
+    dists = np.einsum("ij,ij->i", diff, diff)
+    # Segments are contiguous, so sorting by (segment, distance) keeps each segment in place
+    ranked = order[np.lexsort((dists, seg))]
+    return cluster_ids, starts, sizes, ranked
+
+
+def _summarize_clusters(
+    themes: List[str],
+    labels: np.ndarray,
+    X: np.ndarray,
+    occurrence_idx: np.ndarray,
+    comment_idx: np.ndarray,
+    algorithm: str = "HDBSCAN",
+    labeler: Optional[Callable[[List[Dict[str, Any]]], Dict[int, str]]] = None,
+    n_label_samples: int = 8,
+) -> pd.DataFrame:
+    """Build a compact summary dataframe for clusters with exemplar labels and counts.
+
+    `labels` and `X` are aligned with the unique `themes`; `count` is the number of theme
+    occurrences per cluster and `comment_count` the number of distinct comments. When a
+    `labeler` is given, non-noise clusters are labeled from their themes nearest the
+    centroid and `medoid_theme` keeps the medoid; unlabeled clusters fall back to it.
+    """
+    columns = [
+        "cluster_id", "cluster_label", "medoid_theme", "count", "comment_count", "example_themes", "algorithm",
+    ]
+    if len(themes) == 0:
+        return pd.DataFrame(columns=columns)
+    labels = np.asarray(labels, dtype=np.int64)
+    cluster_ids, starts, sizes, ranked = _segment_medoids(labels, X)
+
+    # Occurrence and distinct-comment counts via sorted-index lookups
+    occ_seg = np.searchsorted(cluster_ids, labels[occurrence_idx])
+    counts = np.bincount(occ_seg, minlength=len(cluster_ids))
+    n_comments = int(comment_idx.max()) + 1 if len(comment_idx) else 1
+    pairs = np.sort(occ_seg * n_comments + comment_idx)
+    first = np.ones(len(pairs), dtype=bool)
+    first[1:] = pairs[1:] != pairs[:-1]
+    comment_counts = np.bincount(pairs[first] // n_comments, minlength=len(cluster_ids))
+
+    # Examples keep the original (sorted theme) order within each cluster
+    order = np.argsort(labels, kind="stable")
+    theme_arr = np.asarray(themes, dtype=object)
+    medoids = ranked[starts]
+    medoid_out = np.where(cluster_ids == -1, "noise", theme_arr[medoids]).tolist()
+    examples = [
+        json.dumps(theme_arr[order[s:s + min(5, n)]].tolist(), ensure_ascii=False)
+        for s, n in zip(starts.tolist(), sizes.tolist())
+    ]
+    labels_out = list(medoid_out)
+    if labeler is not None:
+        to_label = [
+            {
                 "cluster_id": int(cid),
-                "cluster_label": "noise",
-                "count": count,
-                "example_themes": json.dumps(sample, ensure_ascii=False),
-                "algorithm": "HDBSCAN",
-            })
-            continue
-        mask = labels == cid
-        idxs = np.where(mask)[0]
-        if len(idxs) == 0:
-            continue
-        centroid = X[idxs].mean(axis=0, keepdims=True)
-        dists = np.linalg.norm(X[idxs] - centroid, axis=1)
-        medoid_idx = idxs[int(np.argmin(dists))]
-        exemplar = themes[medoid_idx]
-        sample = [themes[i] for i in idxs[:5]]
-        rows.append({
-            "cluster_id": int(cid),
-            "cluster_label": exemplar,
-            "count": int(mask.sum()),
-            "example_themes": json.dumps(sample, ensure_ascii=False),
-            "algorithm": "HDBSCAN",
-        })
-    return pd.DataFrame(rows).sort_values(by=["cluster_id"]).reset_index(drop=True)
+                "member_hash": membership_hash(theme_arr[order[s:s + n]].tolist()),
+                "samples": theme_arr[ranked[s:s + min(n_label_samples, n)]].tolist(),
+            }
+            for cid, s, n in zip(cluster_ids.tolist(), starts.tolist(), sizes.tolist())
+            if cid != -1
+        ]
+        generated = labeler(to_label)
+        labels_out = [generated.get(int(cid), m) for cid, m in zip(cluster_ids.tolist(), medoid_out)]
+    return pd.DataFrame({
+        "cluster_id": cluster_ids.astype(int),
+        "cluster_label": labels_out,
+        "medoid_theme": medoid_out,
+        "count": counts.astype(int),
+        "comment_count": comment_counts.astype(int),
+        "example_themes": examples,
+        "algorithm": algorithm,
+    }, columns=columns)
+
+
+def _make_labeler(
+    output_path: str,
+    llm_labels: bool,
+    label_batch_size: int,
+    label_cache_path: Optional[str],
+) -> Optional[Callable[[List[Dict[str, Any]]], Dict[int, str]]]:
+    """Return the cluster labeler for an output path, or None to keep medoid labels."""
+    if not llm_labels:
+        return None
+    cache_path = label_cache_path or os.path.join(
+        os.path.dirname(os.path.abspath(output_path)), ".cluster_label_cache.json"
+    )
+    return partial(label_clusters, cache_path=cache_path, batch_size=label_batch_size)
 
 
 def cluster_themes(
@@ -85,30 +170,47 @@ def cluster_themes(
     output_path: str,
     themes_column: str = "themes",
     min_cluster_size: int = 5,
+    llm_labels: bool = True,
+    label_batch_size: int = 25,
+    label_cache_path: Optional[str] = None,
 ) -> Tuple[int, str]:
     """Cluster themes from a results spreadsheet and write a cluster summary Excel.
 
+    With `llm_labels`, clusters are named by batched LLM calls cached by membership hash
+    in `label_cache_path` (default: `.cluster_label_cache.json` next to the output), so
+    incremental runs only relabel clusters whose membership changed.
+
     Returns the number of clusters (rows) written and the output path.
     """
-    df = pd.read_excel(input_path)
+    metrics.reset()
+    run_start = time.perf_counter()
+    with metrics.stage("read"):
+        df = pd.read_excel(input_path)
     if themes_column not in df.columns:
         raise ValueError(f"Missing themes column: {themes_column}")
 
-    # Explode into a single list of themes
-    all_themes: List[str] = []
-    for cell in df[themes_column].tolist():
-        all_themes.extend(_parse_themes_cell(cell))
-
-    # Deduplicate while preserving counts
-    # For clustering, use unique themes; for counts we use occurrences via labels mapping later
-    unique_themes = sorted(set(t for t in all_themes if t))
+    # Explode into unique themes plus per-occurrence indices (theme and source comment)
+    unique_themes, occurrence_idx, comment_idx = _explode_themes(df[themes_column].tolist())
     if len(unique_themes) == 0:
         # Nothing to cluster
-        empty = pd.DataFrame(columns=["cluster_id", "cluster_label", "count", "example_themes", "algorithm"])
-        empty.to_excel(output_path, index=False)
+        empty = _summarize_clusters([], np.empty(0), np.empty((0, 0)), occurrence_idx, comment_idx)
+        with metrics.stage("write"):
+            empty.to_excel(output_path, index=False)
+        write_run_report(output_path, run={
+            "command": "cluster",
+            "input": input_path,
+            "output": output_path,
+            "themes": 0,
+            "unique_themes": 0,
+            "clusters": 0,
+            "algorithm": None,
+            "wall_seconds": time.perf_counter() - run_start,
+        })
         return 0, output_path
 
-    X = embed_texts(unique_themes)
+    with metrics.stage("embed"):
+        X = embed_texts(unique_themes)
+    cluster_start = time.perf_counter()
     scaler = StandardScaler()
     Xs = scaler.fit_transform(X)
 
@@ -117,7 +219,8 @@ def cluster_themes(
     labels_unique = hdb.fit_predict(Xs)
 
     # If poor clustering (all noise or single cluster), fallback to KMeans with silhouette selection
-    valid_labels = set(int(l) for l in labels_unique if l != -1)
+    algorithm = "HDBSCAN"
+    valid_labels = np.unique(labels_unique[labels_unique != -1])
     if len(valid_labels) <= 1 and len(unique_themes) >= 2:
         max_k = min(50, max(2, len(unique_themes)))
         best_k = None
@@ -136,19 +239,90 @@ def cluster_themes(
                 best_labels = klabels
         if best_labels is not None:
             labels_unique = best_labels  # type: ignore[assignment]
+            algorithm = "KMeans"
+    metrics.add_stage_time("cluster", time.perf_counter() - cluster_start)
 
-    # Build mapping from unique_themes to labels
-    theme_to_label = {t: int(l) for t, l in zip(unique_themes, labels_unique)}
+    if algorithm == "HDBSCAN":
+        # Keep the condensed tree so other granularities can be cut without refitting
+        tree_path = save_tree(
+            tree_cache_path(output_path), hdb.condensed_tree_.to_numpy(), unique_themes, Xs,
+            occurrence_idx, comment_idx, min_cluster_size,
+        )
+        logger.info("Saved condensed tree -> %s", tree_path)
 
-    # Expand counts per cluster using original occurrences
-    labels_for_all = np.array([theme_to_label.get(t, -1) for t in all_themes], dtype=int)
+    labeler = _make_labeler(output_path, llm_labels, label_batch_size, label_cache_path)
 
-    # Summarize clusters using embeddings of unique themes
-    summary = _summarize_clusters(unique_themes, np.array(list(theme_to_label.values())), Xs)
+    # Summarize clusters using embeddings of unique themes; counts come from all occurrences
+    with metrics.stage("summarize"):
+        summary = _summarize_clusters(
+            unique_themes, np.asarray(labels_unique), Xs, occurrence_idx, comment_idx,
+            algorithm=algorithm, labeler=labeler,
+        )
 
-    # Recompute counts from all occurrences
-    counts = pd.Series(labels_for_all).value_counts().to_dict()
-    summary["count"] = summary["cluster_id"].map(lambda cid: int(counts.get(int(cid), 0)))
-
-    summary.to_excel(output_path, index=False)
+    with metrics.stage("write"):
+        summary.to_excel(output_path, index=False)
+    write_run_report(output_path, run={
+        "command": "cluster",
+        "input": input_path,
+        "output": output_path,
+        "themes": int(len(occurrence_idx)),
+        "unique_themes": len(unique_themes),
+        "clusters": len(summary),
+        "algorithm": algorithm,
+        "wall_seconds": time.perf_counter() - run_start,
+    })
     return len(summary), output_path
+
+
+def recut_clusters(
+    tree_path: str,
+    output_path: str,
+    min_cluster_sizes: List[int],
+    llm_labels: bool = False,
+    label_batch_size: int = 25,
+    label_cache_path: Optional[str] = None,
+) -> Tuple[int, str]:
+    """Re-cut a cached condensed tree at one or more granularities without refitting.
+
+    A single size writes the same summary layout as `cluster_themes`. Several sizes write
+    a topic hierarchy, coarsest first: one `level_N` sheet per size (finer levels carry
+    the `parent_cluster_id` of the enclosing coarser cluster) plus a `themes` sheet with
+    each theme's cluster at every level.
+
+    Returns the number of clusters at the finest level and the output path.
+    """
+    tree = load_tree(tree_path)
+    themes: List[str] = tree["themes"]
+    X = tree["X"]
+    occurrence_idx = tree["occurrence_idx"]
+    comment_idx = tree["comment_idx"]
+    labeler = _make_labeler(output_path, llm_labels, label_batch_size, label_cache_path)
+
+    sizes = sorted({int(m) for m in min_cluster_sizes}, reverse=True)
+    levels = [select_clusters(tree, m)[0] for m in sizes]
+    summaries = [
+        _summarize_clusters(
+            themes, labels, X, occurrence_idx, comment_idx, algorithm=f"HDBSCAN(min_cluster_size={m})",
+            labeler=labeler,
+        )
+        for m, labels in zip(sizes, levels)
+    ]
+
+    if len(levels) == 1:
+        summaries[0].to_excel(output_path, index=False)
+        return len(summaries[0]), output_path
+
+    for i in range(1, len(levels)):
+        parents = nest_levels(levels[i - 1], levels[i])
+        summaries[i].insert(
+            1, "parent_cluster_id",
+            [parents.get(int(cid), -1) if cid != -1 else -1 for cid in summaries[i]["cluster_id"]],
+        )
+    themes_df = pd.DataFrame({"theme": themes})
+    for i, labels in enumerate(levels, start=1):
+        themes_df[f"level_{i}_cluster_id"] = labels
+    with pd.ExcelWriter(output_path) as writer:
+        for i, summary in enumerate(summaries, start=1):
+            summary.to_excel(writer, sheet_name=f"level_{i}", index=False)
+        themes_df.to_excel(writer, sheet_name="themes", index=False)
+    return len(summaries[-1]), output_path
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+import json
 import os
 from dataclasses import dataclass
 from functools import lru_cache
+from typing import Any, Dict, Tuple
+
 from dotenv import load_dotenv
 
 
@@ -13,6 +16,33 @@ class Settings:
     azure_openai_api_version: str
     azure_openai_chat_deployment: str
     azure_openai_embedding_deployment: str
+    # Backend pool (see src/llm/backends.py); empty means a pool of the endpoint above
+    azure_openai_backends: Tuple[Dict[str, Any], ...] = ()
+    azure_openai_routing: str = "weighted"
+    backend_eject_seconds: float = 30.0
+    backend_max_failures: int = 3
+
+
+def _backend_specs(raw: str) -> Tuple[Dict[str, Any], ...]:
+    """Parse `AZURE_OPENAI_BACKENDS`: a JSON list inline or a path to a JSON file.
+
+    A spec's `api_key_env` is resolved here to the value of the variable it names.
+    """
+    if not raw:
+        return ()
+    if not raw.startswith("["):
+        with open(raw, "r", encoding="utf-8") as f:
+            raw = f.read()
+    specs = json.loads(raw)
+    if not isinstance(specs, list) or not specs or not all(isinstance(s, dict) for s in specs):
+        raise RuntimeError("AZURE_OPENAI_BACKENDS must be a non-empty JSON list of backends.")
+    resolved = []
+    for spec in specs:
+        spec = dict(spec)
+        if spec.get("api_key_env"):
+            spec["api_key"] = os.getenv(spec.pop("api_key_env"), "").strip()
+        resolved.append(spec)
+    return tuple(resolved)
 
 
 @lru_cache(maxsize=1)
@@ -25,14 +55,14 @@ def get_settings() -> Settings:
     api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01").strip()
     chat_dep = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT", "").strip()
     embed_dep = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "").strip()
+    backends = _backend_specs(os.getenv("AZURE_OPENAI_BACKENDS", "").strip())
 
-    if not endpoint or not api_key or not chat_dep or not embed_dep:
+    # With a backend list, the single-endpoint variables are only fallbacks for its fields
+    if not backends and (not endpoint or not api_key):
         missing = [
             name for name, val in [
                 ("AZURE_OPENAI_ENDPOINT", endpoint),
                 ("AZURE_OPENAI_API_KEY", api_key),
-                ("AZURE_OPENAI_CHAT_DEPLOYMENT", chat_dep),
-                ("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", embed_dep),
             ]
             if not val
         ]
@@ -47,4 +77,8 @@ def get_settings() -> Settings:
         azure_openai_api_version=api_version,
         azure_openai_chat_deployment=chat_dep,
         azure_openai_embedding_deployment=embed_dep,
+        azure_openai_backends=backends,
+        azure_openai_routing=os.getenv("AZURE_OPENAI_ROUTING", "weighted").strip() or "weighted",
+        backend_eject_seconds=float(os.getenv("BACKEND_EJECT_SECONDS", "30") or 30),
+        backend_max_failures=int(os.getenv("BACKEND_MAX_FAILURES", "3") or 3),
     )
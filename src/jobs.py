@@ -0,0 +1,384 @@
+from __future__ import annotations
+
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from src.records import ResultRecord
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    input_name TEXT,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    text_column TEXT NOT NULL,
+    processes INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    rows_total INTEGER,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    rows_at_start INTEGER NOT NULL DEFAULT 0,
+    rows_failed INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    result_path TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS job_rows (
+    job_id TEXT NOT NULL,
+    row_idx INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    error TEXT,
+    PRIMARY KEY (job_id, row_idx)
+);
+"""
+
+
+def default_jobs_dir() -> str:
+    """Return the jobs directory (`JOBS_DIR` env, default `data/jobs` under the project root)."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.getenv("JOBS_DIR", os.path.join(root, "data", "jobs"))
+
+
+class JobStore:
+    """SQLite-backed table of processing jobs and their per-row results.
+
+    Rows are persisted as they complete, so progress survives browser reruns and app
+    restarts, partial results can be exported at any time, and a cancelled or interrupted
+    job resumes where it stopped.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def submit(
+        self,
+        input_path: str,
+        output_path: str,
+        text_column: str,
+        processes: Optional[int] = None,
+        input_name: Optional[str] = None,
+        job_id: Optional[str] = None,
+    ) -> str:
+        """Queue a job and return its id.
+
+        `input_path` is an Excel file, or a directory of them for a batch job.
+        """
+        job_id = job_id or uuid.uuid4().hex[:12]
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, input_name, input_path, output_path, text_column, processes, created_at)"
+                " VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, input_name or os.path.basename(input_path), input_path, output_path, text_column,
+                 processes, time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return one job as a dict, or None."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Return the most recent jobs, newest first."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically move the oldest queued job to running and return it."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, rows_at_start = rows_done, error = NULL"
+                " WHERE id = ?",
+                (time.time(), row["id"]),
+            )
+        return self.get(row["id"])
+
+    def requeue_interrupted(self) -> int:
+        """Return jobs left 'running' by a previous app process to the queue."""
+        with closing(self._connect()) as conn, conn:
+            cur = conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+        return cur.rowcount
+
+    def set_total(self, job_id: str, rows_total: int) -> None:
+        """Record the job's row count once its input has been read."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE jobs SET rows_total = ? WHERE id = ?", (rows_total, job_id))
+
+    def record_rows(self, job_id: str, rows: List[Any]) -> None:
+        """Persist completed `(row_idx, ResultRecord, error)` tuples and refresh progress counts."""
+        if not rows:
+            return
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO job_rows (job_id, row_idx, result, error) VALUES (?, ?, ?, ?)",
+                [(job_id, int(idx), json.dumps(result.to_dict(), ensure_ascii=False), err)
+                 for idx, result, err in rows],
+            )
+            conn.execute(
+                "UPDATE jobs SET rows_done = (SELECT COUNT(*) FROM job_rows WHERE job_id = ?),"
+                " rows_failed = (SELECT COUNT(*) FROM job_rows WHERE job_id = ? AND error IS NOT NULL)"
+                " WHERE id = ?",
+                (job_id, job_id, job_id),
+            )
+
+    def done_rows(self, job_id: str, include_failed: bool = True) -> Dict[int, ResultRecord]:
+        """Return the stored results of a job keyed by row index (optionally only successful rows)."""
+        query = "SELECT row_idx, result FROM job_rows WHERE job_id = ?"
+        if not include_failed:
+            query += " AND error IS NULL"
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, (job_id,)).fetchall()
+        return {int(r["row_idx"]): ResultRecord.from_dict(json.loads(r["result"])) for r in rows}
+
+    def request_cancel(self, job_id: str) -> None:
+        """Cancel a queued job now, or ask the runner to stop a running one."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+
+    def cancel_requested(self, job_id: str) -> bool:
+        """Return True when a cancel was requested for a running job."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def resume(self, job_id: str) -> None:
+        """Re-queue a cancelled or failed job, or a done one with failed rows.
+
+        Successful rows are kept and skipped; failed rows are sent again.
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', cancel_requested = 0, finished_at = NULL, error = NULL"
+                " WHERE id = ? AND (status IN ('cancelled', 'failed') OR (status = 'done' AND rows_failed > 0))",
+                (job_id,),
+            )
+
+    def finish(self, job_id: str, status: str, result_path: Optional[str] = None, error: Optional[str] = None) -> None:
+        """Mark a job done, cancelled or failed."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result_path = COALESCE(?, result_path), error = ?,"
+                " cancel_requested = 0 WHERE id = ?",
+                (status, time.time(), result_path, error, job_id),
+            )
+
+    def partial_output(self, job_id: str) -> bytes:
+        """Build an .xlsx of the job's input with results for the rows completed so far.
+
+        For a batch job this is the combined dataset of all its files.
+        """
+        from src.orchestrator import batch_labels, build_batch_frames, combine_outputs, read_batch
+
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        paths = job_inputs(job)
+        frames, comments, offsets = read_batch(paths, job["text_column"])
+        done = self.done_rows(job_id)
+        out_frames = build_batch_frames(frames, comments, offsets, [done.get(i) for i in range(len(comments))])
+        out_df = combine_outputs(batch_labels(paths), out_frames) if is_batch(job) else out_frames[0]
+        buf = io.BytesIO()
+        out_df.to_excel(buf, index=False)
+        return buf.getvalue()
+
+
+class JobRunner:
+    """Runs queued jobs one at a time on a single shared, bounded process pool.
+
+    One runner thread serves every browser session, so any number of users can queue
+    dockets while the machine only ever runs `max_workers` worker processes. With `warm`,
+    the pool is started as soon as the runner starts and kept for the life of the server,
+    so no run pays for worker startup.
+    """
+
+    def __init__(
+        self, store: JobStore, max_workers: Optional[int] = None, flush_every: float = 1.0, warm: bool = False
+    ) -> None:
+        self.store = store
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.flush_every = flush_every
+        self.warm = warm
+        self._executor: Any = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> "JobRunner":
+        """Start the background thread (idempotent); interrupted jobs are re-queued first."""
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            logger.info("Re-queued %s interrupted job(s)", requeued)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="job-runner", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the runner; a running job stops at its next cancel check and can be resumed."""
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _ensure_executor(self) -> Any:
+        from src.orchestrator import make_executor
+
+        if self._executor is None:
+            self._executor = make_executor(self.max_workers)
+        return self._executor
+
+    def _warm_pool(self) -> None:
+        """Start every pool worker now (SDK imported, clients built) so the first job starts instantly."""
+        from src.orchestrator import warmup
+
+        start = time.perf_counter()
+        try:
+            ex = self._ensure_executor()
+            pids = {f.result() for f in [ex.submit(warmup, 0.2) for _ in range(self.max_workers)]}
+            logger.info("Warm pool ready: %s workers in %.2fs", len(pids), time.perf_counter() - start)
+        except Exception as e:
+            logger.warning("Could not warm the worker pool: %s", e)
+
+    def _loop(self) -> None:
+        if self.warm:
+            self._warm_pool()
+        while not self._stop.is_set():
+            job = self.store.claim_next()
+            if job is None:
+                self._stop.wait(1.0)
+                continue
+            self._run(job)
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        from src.orchestrator import (
+            batch_labels, batch_output_paths, build_batch_frames, combine_outputs, iter_results, read_batch,
+            write_output,
+        )
+        from src.utils.metrics import metrics, write_run_report
+
+        job_id = job["id"]
+        logger.info("Job %s started (%s)", job_id, job["input_name"])
+        metrics.reset()
+        run_start = time.perf_counter()
+        try:
+            executor = self._ensure_executor()
+            # A batch job's files run as one list of rows, so the pool stays full across files
+            paths = job_inputs(job)
+            frames, comments, offsets = read_batch(paths, job["text_column"])
+            self.store.set_total(job_id, len(comments))
+            # Rows that failed on an earlier attempt are retried on resume
+            done = self.store.done_rows(job_id, include_failed=False)
+            inflight = min(self.max_workers, job["processes"] or self.max_workers) * 2
+
+            buffer: List[Any] = []
+            last_flush = time.monotonic()
+            rows = iter_results(
+                comments, executor, skip=done.keys(),
+                should_cancel=lambda: self._stop.is_set() or self.store.cancel_requested(job_id),
+                max_inflight=inflight,
+            )
+            for idx, result, error in rows:
+                buffer.append((idx, result, error))
+                done[idx] = result
+                if time.monotonic() - last_flush >= self.flush_every:
+                    self.store.record_rows(job_id, buffer)
+                    buffer, last_flush = [], time.monotonic()
+            self.store.record_rows(job_id, buffer)
+
+            if len(done) < len(comments):
+                self.store.finish(job_id, "cancelled")
+                logger.info("Job %s cancelled at %s/%s rows", job_id, len(done), len(comments))
+                return
+            out_frames = build_batch_frames(frames, comments, offsets, [done[i] for i in range(len(comments))])
+            files: List[Dict[str, Any]] = []
+            if is_batch(job):
+                labels = batch_labels(paths)
+                for label, out, path in zip(labels, out_frames, batch_output_paths(job["output_path"], labels)):
+                    files.append({"input": label, "rows": len(out), "output": write_output(out, path)})
+                out_df = combine_outputs(labels, out_frames)
+            else:
+                out_df = out_frames[0]
+            result_path = write_output(out_df, job["output_path"])
+            write_run_report(result_path, run={
+                "command": "job",
+                "job_id": job_id,
+                "input": job["input_name"],
+                "output": result_path,
+                **({"files": files} if files else {}),
+                "rows": len(out_df),
+                "wall_seconds": time.perf_counter() - run_start,
+            })
+            self.store.finish(job_id, "done", result_path=result_path)
+            logger.info("Job %s done -> %s", job_id, result_path)
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            self.store.finish(job_id, "failed", error=str(e))
+
+
+def is_batch(job: Dict[str, Any]) -> bool:
+    """True for a batch job, whose input is a directory of workbooks instead of one file."""
+    return os.path.isdir(job["input_path"])
+
+
+def job_inputs(job: Dict[str, Any]) -> List[str]:
+    """The input files of a job, in row order."""
+    from src.orchestrator import expand_inputs
+
+    return expand_inputs(job["input_path"]) if is_batch(job) else [job["input_path"]]
+
+
+def job_throughput(job: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """Return rows/second, percent complete and ETA seconds for a job row."""
+    total = job.get("rows_total") or 0
+    done = job.get("rows_done") or 0
+    started = job.get("started_at")
+    end = job.get("finished_at") or time.time()
+    elapsed = max(end - started, 1e-6) if started else None
+    fresh = done - (job.get("rows_at_start") or 0)
+    rate = fresh / elapsed if elapsed and job.get("status") == "running" else None
+    eta = (total - done) / rate if rate and total else None
+    return {"rate": rate, "pct": (done / total) if total else 0.0, "eta": eta}
+
+
+def format_ts(ts: Optional[float]) -> str:
+    """Format a unix timestamp for display."""
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else ""
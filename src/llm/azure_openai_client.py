@@ -1,50 +1,37 @@
 from __future__ import annotations
 
+import ast
 import json
-import re
 import os
-from typing import Any, Dict, List, Optional
+import re
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
-import numpy as np
-from tenacity import retry, stop_after_attempt, wait_random_exponential
+from tenacity import RetryCallState, retry, stop_after_attempt, wait_random_exponential
 
-from openai import AzureOpenAI
+from openai import AzureOpenAI, RateLimitError
 
+from src.llm.backends import get_pool
+from src.llm.schemas import conform, validate
 from src.utils.logging import get_logger
-from dotenv import load_dotenv
+from src.utils.metrics import metrics
 
+if TYPE_CHECKING:
+    import numpy as np
 
-logger = get_logger(__name__)
 
-
-_client: Optional[AzureOpenAI] = None
+logger = get_logger(__name__)
 
 
 def get_client() -> AzureOpenAI:
-    """Initialize and cache the Azure OpenAI client using environment variables.
+    """Return the client of the first configured backend.
 
-    Expected env vars (see .env.example):
-    - AZURE_OPENAI_ENDPOINT
-    - AZURE_OPENAI_API_KEY
-    - AZURE_OPENAI_API_VERSION (optional, defaults to '2024-02-01')
+    Calls made through `chat_json`/`embed_texts` are routed across all backends instead
+    (see `src.llm.backends`); configure a single endpoint with the usual env vars
+    (AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_OPENAI_API_VERSION) or a pool with
+    AZURE_OPENAI_BACKENDS.
     """
-    global _client
-    if _client is None:
-        load_dotenv(override=False)
-        endpoint = os.getenv("AZURE_OPENAI_ENDPOINT", "").strip()
-        api_key = os.getenv("AZURE_OPENAI_API_KEY", "").strip()
-        api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-01").strip()
-        if not endpoint or not api_key:
-            raise RuntimeError(
-                "Missing AZURE_OPENAI_ENDPOINT or AZURE_OPENAI_API_KEY. Configure your .env."
-            )
-        _client = AzureOpenAI(
-            api_key=api_key,
-            api_version=api_version,
-            azure_endpoint=endpoint,
-        )
-        logger.info("Initialized AzureOpenAI client")
-    return _client
+    return get_pool().backends[0].client
 
 
 def _coerce_json(text: str) -> Any:
@@ -58,49 +45,230 @@ def _coerce_json(text: str) -> Any:
     return json.loads(cleaned)
 
 
-@retry(wait=wait_random_exponential(multiplier=1, max=30), stop=stop_after_attempt(6))
-def chat_json(messages: List[Dict[str, str]], system: Optional[str] = None, temperature: float = 0.0, max_tokens: int = 700) -> Dict[str, Any]:
-    """Call Azure OpenAI chat completion enforcing a JSON object response.
+def _record_retry(retry_state: RetryCallState) -> None:
+    """Tenacity `before_sleep` hook counting retries and 429 rate-limit responses."""
+    exc = retry_state.outcome.exception() if retry_state.outcome else None
+    call = getattr(retry_state.fn, "__name__", "llm").lstrip("_")
+    metrics.inc("llm_retries_total", call=call)
+    if isinstance(exc, RateLimitError) or getattr(exc, "status_code", None) == 429:
+        metrics.inc("llm_rate_limited_total", call=call)
+
+
+def _record_usage(kind: str, resp: Any, elapsed: float) -> None:
+    """Record call count, latency and token usage for one API response."""
+    metrics.inc("llm_calls_total", kind=kind)
+    metrics.observe("llm_call_latency_seconds", elapsed, kind=kind)
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        metrics.inc("llm_prompt_tokens_total", getattr(usage, "prompt_tokens", 0) or 0, kind=kind)
+        if kind == "chat":
+            metrics.inc("llm_completion_tokens_total", getattr(usage, "completion_tokens", 0) or 0, kind=kind)
+
+
+class InvalidResponseError(ValueError):
+    """The model's response could not be parsed or validated, even after repair."""
+
+
+def _close_truncated(text: str) -> str:
+    """Close an unterminated string and any open brackets (e.g. output cut off by max_tokens)."""
+    stack: List[str] = []
+    in_str = escaped = False
+    for ch in text:
+        if in_str:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    tail = '"' if in_str else ""
+    body = re.sub(r"[,:]\s*$", "", text.rstrip() + tail)
+    if stack and stack[-1] == "}":
+        # A key cut off before its value: drop it along with the comma before it
+        body = re.sub(r'(^|[{,])\s*"(?:[^"\\]|\\.)*"\s*$', r"\1", body)
+        body = re.sub(r",\s*$", "", body)
+    return body + "".join(reversed(stack))
+
+
+def _repair_locally(text: str) -> Any:
+    """Best-effort local fixes for near-JSON output; raises ValueError when nothing works."""
+    cleaned = re.sub(r"^```(?:json)?|```$", "", text.strip(), flags=re.MULTILINE).strip()
+    start = min((i for i in (cleaned.find("{"), cleaned.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise ValueError("no JSON object in response")
+    cleaned = cleaned[start:]
+    candidates = [cleaned, _close_truncated(cleaned)]
+    for cand in candidates:
+        no_trailing = re.sub(r",\s*([}\]])", r"\1", cand)
+        try:
+            return json.loads(no_trailing)
+        except ValueError:
+            pass
+        try:
+            # Python-style output: single quotes, True/False/None
+            value = ast.literal_eval(no_trailing)
+            if isinstance(value, (dict, list)):
+                return value
+        except (ValueError, SyntaxError):
+            pass
+    raise ValueError("unrepairable JSON")
+
+
+def _check(value: Any, schema: Optional[Dict[str, Any]]) -> List[str]:
+    """Return validation errors for a parsed response (only "must be an object" without a schema)."""
+    if schema is not None:
+        return validate(conform(value, schema), schema)
+    return [] if isinstance(value, dict) else ["$: expected object"]
+
 
-    Returns a parsed JSON dict (empty dict on failure).
+@retry(
+    wait=wait_random_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(6),
+    before_sleep=_record_retry,
+)
+def _chat_completion(
+    msg_payload: List[Dict[str, str]], temperature: float, max_tokens: int, response_format: Dict[str, Any]
+) -> str:
+    """Send one chat completion (retrying transport errors and 429s) and return its text."""
+    start = time.perf_counter()
+    try:
+        # Each attempt (including tenacity retries) is routed to a healthy backend
+        with get_pool().lease("chat") as backend:
+            resp = backend.client.chat.completions.create(
+                model=backend.deployment("chat"),
+                messages=msg_payload,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                response_format=response_format,
+            )
+    except Exception:
+        metrics.inc("llm_errors_total", kind="chat")
+        raise
+    finally:
+        metrics.add_stage_time("llm", time.perf_counter() - start)
+    _record_usage("chat", resp, time.perf_counter() - start)
+    return resp.choices[0].message.content or ""
+
+
+def _structured_outputs() -> bool:
+    """Whether to send schemas as `json_schema` response formats (`AZURE_OPENAI_STRUCTURED_OUTPUTS`)."""
+    return os.getenv("AZURE_OPENAI_STRUCTURED_OUTPUTS", "0").strip().lower() in ("1", "true", "yes")
+
+
+def chat_json(
+    messages: List[Dict[str, str]],
+    system: Optional[str] = None,
+    temperature: float = 0.0,
+    max_tokens: int = 700,
+    schema: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Call Azure OpenAI chat completion and return a parsed, validated JSON object.
+
+    `schema` is a response format from `src.llm.schemas`; the response is validated
+    against it (and, with `AZURE_OPENAI_STRUCTURED_OUTPUTS=1`, the API is asked to enforce
+    it). An invalid response is repaired as cheaply as possible: local fixes first, then
+    one short "fix this JSON" call, and only then the full request is sent again (up to
+    `LLM_INVALID_RETRIES` times, default 1). Transport errors and 429s are retried
+    separately with backoff.
+
+    Raises:
+        InvalidResponseError: If no valid response could be obtained.
     """
-    client = get_client()
+    name = schema["name"] if schema else "json"
     msg_payload: List[Dict[str, str]] = []
     if system:
         msg_payload.append({"role": "system", "content": system})
     msg_payload.extend(messages)
+    response_format: Dict[str, Any] = {"type": "json_object"}
+    if schema is not None and _structured_outputs():
+        response_format = {"type": "json_schema", "json_schema": schema}
 
-    # Required chat deployment name from env
-    chat_model = os.getenv("AZURE_OPENAI_CHAT_DEPLOYMENT", "").strip()
-    if not chat_model:
-        raise RuntimeError("Missing AZURE_OPENAI_CHAT_DEPLOYMENT in environment.")
-
-    resp = client.chat.completions.create(
-        model=chat_model,
-        messages=msg_payload,
-        temperature=temperature,
-        max_tokens=max_tokens,
-        response_format={"type": "json_object"},
-    )
-    content = resp.choices[0].message.content or "{}"
+    full_retries = int(os.getenv("LLM_INVALID_RETRIES", "1") or 0)
+    errors: List[str] = []
+    for attempt in range(full_retries + 1):
+        if attempt:
+            metrics.inc("llm_repairs_total", method="full_retry", schema=name)
+        content = _chat_completion(msg_payload, temperature, max_tokens, response_format)
+        metrics.inc("llm_responses_total", schema=name)
+        try:
+            value = _coerce_json(content)
+            errors = _check(value, schema)
+        except ValueError as e:
+            value, errors = None, [f"$: invalid JSON ({e})"]
+        if not errors:
+            return conform(value, schema) if schema else value
+        metrics.inc("llm_parse_failures_total", schema=name)
+        logger.warning("Invalid %s response (%s); repairing", name, "; ".join(errors[:3]))
+
+        with metrics.stage("repair"):
+            try:
+                value = _repair_locally(content)
+                errors = _check(value, schema)
+            except ValueError:
+                errors = errors or ["$: invalid JSON"]
+            if not errors:
+                metrics.inc("llm_repairs_total", method="local", schema=name)
+                return conform(value, schema) if schema else value
+
+            value, fix_errors = _fix_json(content, errors, schema, response_format)
+            if not fix_errors:
+                metrics.inc("llm_repairs_total", method="followup", schema=name)
+                return value
+
+    metrics.inc("llm_invalid_responses_total", schema=name)
+    raise InvalidResponseError(f"Invalid {name} response after repair: {'; '.join(errors[:3])}")
+
+
+_FIX_SYSTEM = (
+    "You fix malformed JSON. Return ONLY the corrected JSON object, keeping the original "
+    "content; change only what is needed to make it valid and match the schema."
+)
+
+
+def _fix_json(
+    content: str, errors: List[str], schema: Optional[Dict[str, Any]], response_format: Dict[str, Any]
+) -> Tuple[Any, List[str]]:
+    """Ask the model to correct its own output; returns `(value, errors)`."""
+    parts = [f"Output to fix:\n{content[:8000]}", "Problems:\n" + "\n".join(errors[:10])]
+    if schema is not None:
+        parts.append(f"Schema:\n{json.dumps(schema['schema'])}")
+    messages = [{"role": "system", "content": _FIX_SYSTEM}, {"role": "user", "content": "\n\n".join(parts)}]
     try:
-        return _coerce_json(content)
-    except Exception as e:
-        logger.warning("Falling back to best-effort JSON parsing: %s", e)
-        return json.loads("{}")
+        fixed = _chat_completion(messages, 0.0, max(200, len(content) // 3 + 100), response_format)
+        value = _repair_locally(fixed)
+    except ValueError as e:
+        return None, [f"$: repair failed ({e})"]
+    errors = _check(value, schema)
+    return (conform(value, schema) if schema and not errors else value), errors
 
 
-@retry(wait=wait_random_exponential(multiplier=1, max=30), stop=stop_after_attempt(6))
+@retry(
+    wait=wait_random_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(6),
+    before_sleep=_record_retry,
+)
 def embed_texts(texts: List[str], batch_size: int = 100) -> np.ndarray:
     """Generate embeddings for a list of texts using the embedding deployment from env."""
-    client = get_client()
-    model = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "").strip()
-    if not model:
-        raise RuntimeError("Missing AZURE_OPENAI_EMBEDDING_DEPLOYMENT in environment.")
+    import numpy as np
+
+    pool = get_pool()
     all_vecs: List[List[float]] = []
     for i in range(0, len(texts), batch_size):
         batch = texts[i:i+batch_size]
-        resp = client.embeddings.create(model=model, input=batch)
+        start = time.perf_counter()
+        try:
+            with pool.lease("embedding") as backend:
+                resp = backend.client.embeddings.create(model=backend.deployment("embedding"), input=batch)
+        except Exception:
+            metrics.inc("llm_errors_total", kind="embedding")
+            raise
+        _record_usage("embedding", resp, time.perf_counter() - start)
         vecs = [d.embedding for d in resp.data]
         all_vecs.extend(vecs)
     return np.array(all_vecs, dtype=np.float32)
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from openai import APIConnectionError, AzureOpenAI, RateLimitError
+
+from src.config.settings import Settings, get_settings
+from src.utils.logging import get_logger
+from src.utils.metrics import metrics
+
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class Backend:
+    """One Azure OpenAI endpoint plus its deployments and relative quota weight."""
+
+    name: str
+    endpoint: str
+    api_key: str
+    api_version: str = "2024-02-01"
+    chat_deployment: str = ""
+    embedding_deployment: str = ""
+    weight: float = 1.0
+    # Routing state (per process)
+    outstanding: int = 0
+    ejected_until: float = 0.0
+    failures: int = 0
+    ejections: int = 0
+    current: float = 0.0
+    _client: Any = field(default=None, repr=False)
+
+    def deployment(self, kind: str) -> str:
+        """Return the deployment name serving `kind` ("chat" or "embedding"), or ""."""
+        return self.chat_deployment if kind == "chat" else self.embedding_deployment
+
+    @property
+    def client(self) -> AzureOpenAI:
+        """Lazily built `AzureOpenAI` client for this backend."""
+        if self._client is None:
+            self._client = _make_client(self)
+        return self._client
+
+
+def _make_client(backend: Backend) -> AzureOpenAI:
+    """Build the SDK client for a backend."""
+    client = AzureOpenAI(api_key=backend.api_key, api_version=backend.api_version, azure_endpoint=backend.endpoint)
+    logger.info("Initialized AzureOpenAI client for backend %s", backend.name)
+    return client
+
+
+def load_backends(settings: Optional[Settings] = None) -> List[Backend]:
+    """Build the backend pool from settings.
+
+    `AZURE_OPENAI_BACKENDS` holds a JSON list (inline, or a path to a JSON file) of objects
+    with `name`, `endpoint`, `api_key` (or `api_key_env`, the name of the variable holding
+    it), `api_version`, `chat_deployment`, `embedding_deployment` and `weight`. Omitted
+    fields fall back to the single-endpoint `AZURE_OPENAI_*` variables, which on their own
+    describe a pool of one.
+    """
+    settings = settings or get_settings()
+    defaults = {
+        "endpoint": settings.azure_openai_endpoint,
+        "api_key": settings.azure_openai_api_key,
+        "api_version": settings.azure_openai_api_version,
+        "chat_deployment": settings.azure_openai_chat_deployment,
+        "embedding_deployment": settings.azure_openai_embedding_deployment,
+    }
+    specs = settings.azure_openai_backends or ({"name": "default"},)
+
+    backends: List[Backend] = []
+    for i, spec in enumerate(specs):
+        cfg = {**defaults, **{k: str(v).strip() for k, v in spec.items() if k in defaults and v is not None}}
+        name = str(spec.get("name") or f"backend{i}")
+        if not cfg["endpoint"] or not cfg["api_key"]:
+            raise RuntimeError(f"Backend {name} is missing an endpoint or API key. Configure your .env.")
+        backends.append(Backend(name=name, weight=max(float(spec.get("weight", 1.0)), 1e-6), **cfg))
+    return backends
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds the server asked us to back off for, from a 429 response's headers."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            if headers.get(name) is not None:
+                return float(headers[name]) * scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def _is_rate_limit(exc: BaseException) -> bool:
+    return isinstance(exc, RateLimitError) or getattr(exc, "status_code", None) == 429
+
+
+def _is_unhealthy(exc: BaseException) -> bool:
+    """Connection failures, timeouts and 5xx responses count against a backend's health."""
+    status = getattr(exc, "status_code", None)
+    return (isinstance(status, int) and status >= 500) or isinstance(exc, APIConnectionError)
+
+
+class BackendPool:
+    """Routes calls across backends and ejects the ones that are throttled or failing.
+
+    Routing is `weighted` (smooth weighted round-robin) or `least_outstanding` (fewest
+    in-flight calls per unit of weight, ties broken by weighted round-robin). A 429 ejects
+    a backend for its `Retry-After` (else `eject_seconds`, doubling while it keeps
+    happening); `max_failures` consecutive connection/5xx errors eject it the same way.
+    When every backend serving a call kind is ejected, the one returning soonest is used.
+
+    State is per process: each pool worker balances its own calls. A pool worker makes
+    one call at a time, so its outstanding counts are always 0 and `least_outstanding`
+    only differs from `weighted` for callers that share a pool across threads.
+    """
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        strategy: str = "weighted",
+        eject_seconds: float = 30.0,
+        max_failures: int = 3,
+    ) -> None:
+        if strategy not in ("least_outstanding", "weighted"):
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        self.backends = backends
+        self.strategy = strategy
+        self.eject_seconds = eject_seconds
+        self.max_failures = max_failures
+        self._lock = threading.Lock()
+
+    def acquire(self, kind: str) -> Backend:
+        """Pick a backend for one `kind` call and count it as outstanding."""
+        with self._lock:
+            serving = [b for b in self.backends if b.deployment(kind)]
+            if not serving:
+                raise RuntimeError(f"No backend has a {kind} deployment configured.")
+            now = time.monotonic()
+            healthy = [b for b in serving if b.ejected_until <= now]
+            if not healthy:
+                backend = min(serving, key=lambda b: b.ejected_until)
+            else:
+                # Smooth weighted round-robin, optionally restricted to the least loaded
+                total = sum(b.weight for b in healthy)
+                for b in healthy:
+                    b.current += b.weight
+                candidates = healthy
+                if self.strategy == "least_outstanding":
+                    low = min(b.outstanding / b.weight for b in healthy)
+                    candidates = [b for b in healthy if b.outstanding / b.weight == low]
+                backend = max(candidates, key=lambda b: b.current)
+                backend.current -= total
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend: Backend, error: Optional[BaseException] = None) -> None:
+        """Return a backend after a call, updating its health from the outcome."""
+        with self._lock:
+            backend.outstanding -= 1
+            if error is None:
+                backend.failures = 0
+                return
+            if _is_rate_limit(error):
+                backend.failures += 1
+                self._eject(backend, _retry_after(error), "rate limited")
+            elif _is_unhealthy(error):
+                backend.failures += 1
+                if backend.failures >= self.max_failures:
+                    self._eject(backend, None, f"{backend.failures} consecutive failures")
+
+    def _eject(self, backend: Backend, seconds: Optional[float], reason: str) -> None:
+        if seconds is None:
+            seconds = min(self.eject_seconds * 2 ** max(backend.failures - 1, 0), 300.0)
+        backend.ejected_until = time.monotonic() + seconds
+        backend.ejections += 1
+        metrics.inc("llm_backend_ejections_total", backend=backend.name)
+        logger.warning("Ejecting backend %s for %.1fs (%s)", backend.name, seconds, reason)
+
+    @contextmanager
+    def lease(self, kind: str) -> Iterator[Backend]:
+        """Hold a backend for one call, recording per-backend requests, errors and latency."""
+        backend = self.acquire(kind)
+        start = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            yield backend
+        except BaseException as e:
+            error = e
+            metrics.inc("llm_backend_errors_total", backend=backend.name, kind=kind)
+            if _is_rate_limit(e):
+                metrics.inc("llm_backend_rate_limited_total", backend=backend.name, kind=kind)
+            raise
+        finally:
+            metrics.inc("llm_backend_requests_total", backend=backend.name, kind=kind)
+            metrics.observe("llm_backend_latency_seconds", time.perf_counter() - start, backend=backend.name)
+            self.release(backend, error)
+
+
+_pool: Optional[BackendPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> BackendPool:
+    """Return the process-wide backend pool, built from settings on first use.
+
+    The routing strategy comes from `AZURE_OPENAI_ROUTING` (`weighted` or `least_outstanding`).
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                settings = get_settings()
+                _pool = BackendPool(
+                    load_backends(settings),
+                    strategy=settings.azure_openai_routing,
+                    eject_seconds=settings.backend_eject_seconds,
+                    max_failures=settings.backend_max_failures,
+                )
+    return _pool
+
+
+def prebuild_clients() -> None:
+    """Build every backend's client now instead of on its first call (used to warm pool workers)."""
+    for backend in get_pool().backends:
+        _ = backend.client
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+
+def _verdict_fields(*categories: str) -> Dict[str, Any]:
+    props: Dict[str, Any] = {}
+    for cat in categories:
+        props[f"{cat}_ver"] = {"type": "string", "enum": ["True", "False"]}
+        props[f"{cat}_txt"] = {"type": "array", "items": {"type": "string"}}
+    return props
+
+
+def _strict_object(properties: Dict[str, Any]) -> Dict[str, Any]:
+    """An object schema requiring every property and nothing else (as structured outputs need)."""
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+# Response formats in the shape of the chat API's `json_schema` response format
+TASK_ONE_SCHEMA: Dict[str, Any] = {
+    "name": "task_one",
+    "strict": True,
+    "schema": _strict_object(_verdict_fields("pii", "third_pty_info", "ssa_employee", "offensive_lang")),
+}
+
+TASK_TWO_SCHEMA: Dict[str, Any] = {
+    "name": "task_two",
+    "strict": True,
+    "schema": _strict_object({
+        "overall_opinion": {"type": "string", "enum": ["support", "oppose", "unknown"]},
+        "themes": {"type": "array", "items": {"type": "string"}},
+    }),
+}
+
+CLUSTER_LABELS_SCHEMA: Dict[str, Any] = {
+    "name": "cluster_labels",
+    "strict": True,
+    "schema": _strict_object({
+        "labels": {
+            "type": "array",
+            "items": _strict_object({"id": {"type": "integer"}, "label": {"type": "string"}}),
+        },
+    }),
+}
+
+
+def _conform(value: Any, schema: Dict[str, Any]) -> Any:
+    expected = schema.get("type")
+    if expected == "object" and isinstance(value, dict):
+        props = schema.get("properties", {})
+        return {k: _conform(v, props[k]) if k in props else v for k, v in value.items()}
+    if expected == "array":
+        if value is None:
+            return []
+        if isinstance(value, str):
+            value = [value] if value.strip() else []
+        if isinstance(value, list) and "items" in schema:
+            return [_conform(v, schema["items"]) for v in value]
+        return value
+    if expected == "string" and "enum" in schema:
+        if isinstance(value, bool):
+            value = str(value)
+        if isinstance(value, str):
+            by_lower = {str(e).lower(): e for e in schema["enum"]}
+            return by_lower.get(value.strip().lower(), value)
+    if expected == "integer" and isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value)
+    return value
+
+
+def conform(value: Any, response_format: Dict[str, Any]) -> Any:
+    """Apply lossless local fixes toward a schema before validating.
+
+    Fixes enum case ("true" -> "True", "Oppose" -> "oppose"), booleans given for
+    "True"/"False" strings, a bare string or null where a list is expected, and numeric
+    strings for integers. Anything else is left for validation to report.
+    """
+    return _conform(value, response_format["schema"])
+
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def _errors(value: Any, schema: Dict[str, Any], path: str, out: List[str]) -> None:
+    """Collect errors for the schema subset used here: type, enum, properties, required, items."""
+    expected = schema.get("type")
+    if expected is not None:
+        py_type = _TYPES[expected]
+        # bool is an int subclass; do not accept it as a number
+        if not isinstance(value, py_type) or (expected in ("integer", "number") and isinstance(value, bool)):
+            out.append(f"{path}: expected {expected}, got {type(value).__name__}")
+            return
+    if "enum" in schema and value not in schema["enum"]:
+        out.append(f"{path}: {value!r} is not one of {schema['enum']}")
+    if isinstance(value, dict):
+        props = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                out.append(f"{path}: missing required property {key!r}")
+        for key, sub in value.items():
+            if key in props:
+                _errors(sub, props[key], f"{path}.{key}", out)
+            elif schema.get("additionalProperties") is False:
+                out.append(f"{path}: unexpected property {key!r}")
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            _errors(item, schema["items"], f"{path}[{i}]", out)
+
+
+def validate(value: Any, response_format: Dict[str, Any]) -> List[str]:
+    """Validate a parsed response against a response format's schema; returns error messages.
+
+    Uses `jsonschema` when it is installed, else a small built-in validator covering the
+    keywords these schemas use.
+    """
+    schema = response_format["schema"]
+    try:
+        import jsonschema
+    except ImportError:
+        out: List[str] = []
+        _errors(value, schema, "$", out)
+        return out
+    validator = jsonschema.Draft202012Validator(schema)
+    return [
+        f"$.{'.'.join(str(p) for p in err.absolute_path)}: {err.message}" if err.absolute_path else f"$: {err.message}"
+        for err in validator.iter_errors(value)
+    ]
@@ -1,35 +1,370 @@
 from __future__ import annotations
 
-import json
+import bisect
+import glob
 import os
+import re
+import time
 from datetime import datetime
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import Any, Dict, Optional, Tuple, List
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, Optional, Sequence, Set, Tuple, List
 
-import pandas as pd
-from tqdm import tqdm
-
-from src.task_one import review_comment_for_redactions
-from src.task_two import extract_themes
+from src.chunking import chunk_limits, split_comment
+from src.quote_spans import locate_quotes
+from src.records import ResultRecord, assign_columns
+from src.scheduling import estimate_tokens, lpt_order
+from src.task_one import merge_chunk_results, review_comment_for_redactions
+from src.task_two import extract_themes, reduce_themes
 from src.utils.logging import get_logger
+from src.utils.metrics import metrics, write_run_report
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 logger = get_logger(__name__)
 
+# Datetime stamp added by `stamp_output_path`, e.g. "_01302025_0352PM"
+_STAMP = r"_\d{8}_\d{4}[AP]M"
+_PROCESSED_OUTPUT = re.compile(r"_processed(?:_\d+)?" + _STAMP + r"\.xlsx$", re.IGNORECASE)
+
+
+class _RowError(Exception):
+    """A row failure that carries the worker's metrics snapshot back to the parent."""
 
-def _process_single(comment: str) -> Dict[str, Any]:
-    """Run Task One and Task Two on a single comment and merge the dictionaries."""
-    t1 = review_comment_for_redactions(comment)
-    t2 = extract_themes(comment)
-    return {**t1, **t2}
+    def __init__(self, message: str, snapshot: Dict[str, Any]) -> None:
+        super().__init__(message, snapshot)
+        self.message = message
+        self.snapshot = snapshot
 
+    def __str__(self) -> str:
+        return self.message
 
-def _serialize_list(val: Any) -> str:
-    """Serialize a value as a JSON list string, coercing non-lists to sane defaults."""
+
+def _worker_init(profile_dir: Optional[str] = None) -> None:
+    """Pool worker initializer: start from an empty metrics registry (fork copies the parent's).
+
+    Also builds the LLM clients up front. With `profile_dir`, the worker is also profiled
+    until it exits (see `--profile`).
+    """
+    metrics.reset()
+    if profile_dir:
+        from src.utils.profiling import init_worker_profiling
+        init_worker_profiling(profile_dir)
+    # Pay for the SDK import and client construction once per worker, not on its first row
     try:
-        return json.dumps(val, ensure_ascii=False)
-    except Exception:
-        return "[]" if not val else json.dumps([str(val)], ensure_ascii=False)
+        from src.llm.backends import prebuild_clients
+        prebuild_clients()
+    except Exception as e:
+        logger.warning("Could not prebuild LLM clients in worker: %s", e)
+
+
+def warmup(hold_seconds: float = 0.0) -> int:
+    """No-op task used to start pool workers (and run their initializer) ahead of real work.
+
+    Holding each task briefly makes concurrent warm-ups land on distinct workers.
+    """
+    time.sleep(hold_seconds)
+    return os.getpid()
+
+
+def _process_single(comment: str) -> Tuple[ResultRecord, Dict[str, Any]]:
+    """Run Task One and Task Two on a single comment and merge them into a compact record.
+
+    Returns the record plus this worker's drained metrics snapshot for the parent.
+    """
+    try:
+        t1 = review_comment_for_redactions(comment)
+        t2 = extract_themes(comment)
+    except Exception as e:
+        # Carry the failed row's metrics (retries, 429s) back with the error
+        raise _RowError(str(e), metrics.drain()) from e
+    return ResultRecord.from_dict({**t1, **t2}), metrics.drain()
+
+
+def _reduce_chunks(chunk_results: List[ResultRecord]) -> Tuple[ResultRecord, Dict[str, Any]]:
+    """Combine the per-chunk results of one long comment into its row result.
+
+    Task One quotes are unioned locally; Task Two themes are merged and reduced with one
+    final model call. Returns the row result plus this worker's drained metrics snapshot.
+    """
+    try:
+        with metrics.stage("reduce"):
+            parts = [r.to_dict() for r in chunk_results]
+            t1 = merge_chunk_results(parts)
+            t2 = reduce_themes(parts)
+    except Exception as e:
+        raise _RowError(str(e), metrics.drain()) from e
+    return ResultRecord.from_dict({**t1, **t2}), metrics.drain()
+
+
+def empty_result(error: Optional[str] = None) -> ResultRecord:
+    """Return the placeholder recorded for a failed row, carrying the reason.
+
+    Its result cells are written blank (see `output_columns`), not as "False" verdicts.
+    """
+    return ResultRecord(error=error)
+
+
+def make_executor(processes: Optional[int] = None, profile_dir: Optional[str] = None) -> ProcessPoolExecutor:
+    """Create the worker pool used to process comments."""
+    return ProcessPoolExecutor(max_workers=processes, initializer=_worker_init, initargs=(profile_dir,))
+
+
+def read_comments(input_path: str, text_column: str) -> Tuple[pd.DataFrame, List[str]]:
+    """Read the input Excel and return the frame plus its comment texts."""
+    import pandas as pd
+
+    with metrics.stage("read"):
+        df = pd.read_excel(input_path)
+    if text_column not in df.columns:
+        raise ValueError(f"Missing required text column: {text_column}")
+    return df, df[text_column].fillna("").astype(str).tolist()
+
+
+def expand_inputs(pattern: str, output_path: Optional[str] = None) -> List[str]:
+    """Return the input workbooks matching a glob pattern, or every .xlsx under a directory, sorted.
+
+    Files this tool wrote are skipped so a re-run over the same folder does not read its
+    own results back in: per-file batch outputs (`*_processed_<stamp>.xlsx`) and, when
+    `output_path` is given, the stamped copies of that combined output.
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "**", "*.xlsx")
+    own = [_PROCESSED_OUTPUT]
+    if output_path:
+        base, ext = os.path.splitext(os.path.abspath(output_path))
+        own.append(re.compile(re.escape(base) + _STAMP + re.escape(ext or ".xlsx") + "$"))
+    paths = []
+    for path in glob.glob(pattern, recursive=True):
+        name = os.path.basename(path)
+        # Skip Excel's "~$" lock files left next to open workbooks, and non-Excel matches
+        if not os.path.isfile(path) or name.startswith("~$") or not name.lower().endswith((".xlsx", ".xls")):
+            continue
+        if any(rx.search(os.path.abspath(path)) for rx in own):
+            logger.info("Skipping %s: an output of an earlier run", path)
+            continue
+        paths.append(path)
+    if not paths:
+        raise ValueError(f"No input files match: {pattern}")
+    return sorted(paths)
+
+
+def batch_labels(input_paths: Sequence[str]) -> List[str]:
+    """Short unique name per input file: its path relative to the inputs' common directory."""
+    dirs = [os.path.dirname(os.path.abspath(p)) for p in input_paths]
+    root = os.path.commonpath(dirs) if dirs else ""
+    return [os.path.relpath(os.path.abspath(p), root) for p in input_paths]
+
+
+def batch_output_path(output_path: str, label: str) -> str:
+    """Per-file output path of a batch: `<input name>_processed.xlsx` next to the combined output."""
+    base = os.path.splitext(label)[0].replace(os.sep, "_")
+    return os.path.join(os.path.dirname(output_path), f"{base}_processed.xlsx")
+
+
+def batch_output_paths(output_path: str, labels: Sequence[str]) -> List[str]:
+    """`batch_output_path` of each label, numbering repeats (`_2`, `_3`, ...) so no two files collide.
+
+    Flattened names can repeat, e.g. `sub/b.xlsx` and `sub_b.xlsx`, or `a.xls` and `a.xlsx`.
+    """
+    paths: List[str] = []
+    taken: Set[str] = set()
+    for label in labels:
+        path = batch_output_path(output_path, label)
+        base, ext = os.path.splitext(path)
+        n = 1
+        # Compare case-insensitively, as Windows and macOS filesystems do
+        while path.lower() in taken:
+            n += 1
+            path = f"{base}_{n}{ext}"
+        taken.add(path.lower())
+        paths.append(path)
+    return paths
+
+
+def read_batch(input_paths: Sequence[str], text_column: str) -> Tuple[List[pd.DataFrame], List[str], List[int]]:
+    """Read several input files as one run.
+
+    Returns each file's frame, all comment texts concatenated in file order, and row
+    offsets such that file `i` holds rows `offsets[i]:offsets[i + 1]` of the texts.
+    """
+    frames: List[pd.DataFrame] = []
+    comments: List[str] = []
+    offsets = [0]
+    for path in input_paths:
+        try:
+            df, texts = read_comments(path, text_column)
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from e
+        frames.append(df)
+        comments.extend(texts)
+        offsets.append(len(comments))
+    return frames, comments, offsets
+
+
+def build_batch_frames(
+    frames: Sequence[pd.DataFrame],
+    comments: List[str],
+    offsets: Sequence[int],
+    results: List[Optional[ResultRecord]],
+) -> List[pd.DataFrame]:
+    """Split batch-wide results back into one output frame per input file."""
+    return [
+        build_output_frame(df, results[offsets[i]:offsets[i + 1]], comments[offsets[i]:offsets[i + 1]])
+        for i, df in enumerate(frames)
+    ]
+
+
+def combine_outputs(labels: Sequence[str], out_frames: Sequence[pd.DataFrame]) -> pd.DataFrame:
+    """Stack per-file outputs into one dataset with a leading `source_file` column (ready for `cluster`)."""
+    import pandas as pd
+
+    parts = []
+    for label, out in zip(labels, out_frames):
+        out = out.copy()
+        out.insert(0, "source_file", label)
+        parts.append(out)
+    return pd.concat(parts, ignore_index=True)
+
+
+def iter_results(
+    comments: List[str],
+    executor: ProcessPoolExecutor,
+    skip: Optional[Iterable[int]] = None,
+    should_cancel: Optional[Callable[[], bool]] = None,
+    max_inflight: Optional[int] = None,
+    order: Optional[Sequence[int]] = None,
+) -> Iterator[Tuple[int, ResultRecord, Optional[str]]]:
+    """Process comments on `executor`, yielding `(row_idx, result, error)` as rows complete.
+
+    Comments longer than `CHUNK_TOKENS` are split into overlapping chunks (see
+    `split_comment`) that run as separate tasks; once all chunks of a row are back, one
+    reduce task combines them into the row result. Work is dispatched in `order`, by
+    default longest first (LPT) to shrink the run's tail. Rows repeating an earlier row's
+    exact text are not sent again; they get that row's result when it arrives.
+
+    Failed rows, including those whose responses stayed invalid after repair, yield
+    `empty_result(error)` with the message. At most `max_inflight` tasks are queued on the
+    executor at once, which keeps a shared pool fair across jobs and lets `should_cancel`
+    (polled about twice a second) stop a run promptly; pending tasks are then dropped and
+    iteration ends.
+    """
+    done_rows: Set[int] = set(skip or ())
+    lpt = order is None
+    if order is None:
+        order = range(len(comments))
+    chunk_tokens, overlap_tokens = chunk_limits()
+    with metrics.stage("schedule"):
+        # Work units are (row, chunk_no, text); chunk_no is None for unsplit rows
+        units: List[Tuple[int, Optional[int], str]] = []
+        chunk_results: Dict[int, List[Optional[ResultRecord]]] = {}
+        # Duplicate rows keyed by the first row with the same text
+        first_by_text: Dict[str, int] = {}
+        duplicates: Dict[int, List[int]] = {}
+        for idx in order:
+            if idx in done_rows:
+                continue
+            first = first_by_text.setdefault(comments[idx], idx)
+            if first != idx:
+                duplicates.setdefault(first, []).append(idx)
+                continue
+            chunks = split_comment(comments[idx], chunk_tokens, overlap_tokens)
+            if len(chunks) <= 1:
+                units.append((idx, None, comments[idx]))
+                continue
+            chunk_results[idx] = [None] * len(chunks)
+            units.extend((idx, i, c) for i, c in enumerate(chunks))
+        if duplicates:
+            metrics.inc("rows_deduplicated_total", sum(len(v) for v in duplicates.values()))
+        if chunk_results:
+            metrics.inc("rows_chunked_total", len(chunk_results))
+            metrics.inc("chunks_total", sum(len(v) for v in chunk_results.values()))
+        if lpt:
+            units = [units[i] for i in lpt_order([estimate_tokens(u[2]) for u in units])]
+    limit = max_inflight or len(units) or 1
+    # Values are (row, chunk_no); chunk_no is None for whole rows and -1 for reduce tasks
+    pending: Dict[Future, Tuple[int, Optional[int]]] = {}
+    failed_rows: Set[int] = set()
+    next_pos = 0
+    while next_pos < len(units) or pending:
+        if should_cancel is not None and should_cancel():
+            for fut in pending:
+                fut.cancel()
+            logger.info("Run cancelled with %s tasks pending", len(units) - next_pos + len(pending))
+            return
+        with metrics.stage("dispatch"):
+            while next_pos < len(units) and len(pending) < limit:
+                idx, chunk_no, text = units[next_pos]
+                next_pos += 1
+                if idx in failed_rows:
+                    continue
+                pending[executor.submit(_process_single, text)] = (idx, chunk_no)
+        finished, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+        for fut in finished:
+            idx, chunk_no = pending.pop(fut)
+            # Merge every finished task's metrics, even for a row that already failed, so
+            # the calls and tokens its other chunks used are still counted
+            try:
+                result, snap = fut.result()
+                metrics.merge(snap)
+            except Exception as e:
+                metrics.merge(getattr(e, "snapshot", None))
+                if idx in failed_rows:
+                    continue
+                logger.error("Row %s failed: %s", idx, e)
+                if chunk_no is not None:
+                    failed_rows.add(idx)
+                for row in (idx, *duplicates.get(idx, ())):
+                    yield row, empty_result(str(e)), str(e)
+                continue
+            if idx in failed_rows:
+                continue
+            if chunk_no is None or chunk_no == -1:
+                for row in (idx, *duplicates.get(idx, ())):
+                    yield row, result, None
+                continue
+            parts = chunk_results[idx]
+            parts[chunk_no] = result
+            if all(p is not None for p in parts):
+                # Reduce right away (outside the in-flight limit) so finished rows are not held up
+                del chunk_results[idx]
+                pending[executor.submit(_reduce_chunks, parts)] = (idx, -1)
+
+
+def build_output_frame(
+    df: pd.DataFrame, results: List[Optional[ResultRecord]], comments: Optional[Sequence[str]] = None
+) -> pd.DataFrame:
+    """Merge per-row results into a copy of the input frame (rows without a result stay blank).
+
+    With `comments`, also locates each row's quotes in its comment and adds the
+    `quote_spans`, `redacted_comment` and `unmatched_quotes` columns.
+    """
+    with metrics.stage("merge"):
+        out = assign_columns(df, results)
+    if comments is not None:
+        with metrics.stage("spans"):
+            for col, values in locate_quotes(comments, results).items():
+                out[col] = values
+    return out
+
+
+def stamp_output_path(output_path: str) -> str:
+    """Insert a readable datetime stamp before the extension to ensure unique filenames.
+
+    Example format: 01302025_0352PM
+    """
+    ts = datetime.now().strftime("%m%d%Y_%I%M%p")
+    base, ext = os.path.splitext(output_path)
+    return f"{base}_{ts}{ext or '.xlsx'}"
+
+
+def write_output(out_df: pd.DataFrame, output_path: str) -> str:
+    """Write the merged frame to a timestamped copy of `output_path` and return that path."""
+    stamped_output_path = stamp_output_path(output_path)
+    with metrics.stage("write"):
+        out_df.to_excel(stamped_output_path, index=False)
+    return stamped_output_path
 
 
 def process_file(
@@ -40,6 +375,7 @@ def process_file(
     name_column: Optional[str] = None,
     date_column: Optional[str] = None,
     processes: Optional[int] = None,
+    profile_dir: Optional[str] = None,
 ) -> Tuple[int, str]:
     """Process an Excel file of comments and write Task One & Two outputs.
 
@@ -49,70 +385,116 @@ def process_file(
         text_column: Column name containing the comment text.
         uid_column, name_column, date_column: Reserved for future use.
         processes: Max worker processes for parallelism.
+        profile_dir: When set, pool workers write cProfile/tracemalloc data here.
 
     Returns:
         (row_count, output_path)
     """
-    df = pd.read_excel(input_path)
-    if text_column not in df.columns:
-        raise ValueError(f"Missing required text column: {text_column}")
+    from tqdm import tqdm
 
-    comments = df[text_column].fillna("").astype(str).tolist()
+    metrics.reset()
+    run_start = time.perf_counter()
+    df, comments = read_comments(input_path, text_column)
 
-    results: List[Optional[Dict[str, Any]]] = [None] * len(comments)
-    with ProcessPoolExecutor(max_workers=processes) as ex:
-        futures = {ex.submit(_process_single, c): idx for idx, c in enumerate(comments)}
-        for fut in tqdm(as_completed(futures), total=len(futures), desc="Processing comments"):
-            idx = futures[fut]
-            try:
-                results[idx] = fut.result()
-            except Exception as e:
-                logger.error("Row %s failed: %s", idx, e)
-                results[idx] = {
-                    "pii_ver": "False",
-                    "pii_txt": [],
-                    "third_pty_info_ver": "False",
-                    "third_pty_info_txt": [],
-                    "ssa_employee_ver": "False",
-                    "ssa_employee_txt": [],
-                    "offensive_lang_ver": "False",
-                    "offensive_lang_txt": [],
-                    "overall_opinion": "unknown",
-                    "themes": [],
-                }
-
-    # Merge results
-    out_df = df.copy()
-
-    def get_col(col: str) -> List[Any]:
-        return [r.get(col) if r else None for r in results]
-
-    for col in [
-        "pii_ver",
-        "third_pty_info_ver",
-        "ssa_employee_ver",
-        "offensive_lang_ver",
-        "overall_opinion",
-    ]:
-        out_df[col] = get_col(col)
-
-    for col in [
-        "pii_txt",
-        "third_pty_info_txt",
-        "ssa_employee_txt",
-        "offensive_lang_txt",
-        "themes",
-    ]:
-        out_df[col] = [
-            _serialize_list(vals) if isinstance(vals, (list, tuple)) else _serialize_list([])
-            for vals in get_col(col)
-        ]
-
-    # Insert a readable datetime stamp before the extension to ensure unique filenames
-    # Example format: 01302025_0352PM
-    ts = datetime.now().strftime("%m%d%Y_%I%M%p")
-    base, ext = os.path.splitext(output_path)
-    stamped_output_path = f"{base}_{ts}{ext or '.xlsx'}"
+    results: List[Optional[ResultRecord]] = [None] * len(comments)
+    failed = 0
+    with make_executor(processes, profile_dir) as ex:
+        workers = processes or os.cpu_count() or 1
+        rows = iter_results(comments, ex, max_inflight=workers * 4)
+        for idx, result, error in tqdm(rows, total=len(comments), desc="Processing comments"):
+            results[idx] = result
+            failed += error is not None
+
+    out_df = build_output_frame(df, results, comments)
+    stamped_output_path = write_output(out_df, output_path)
 
-    out_df.to_excel(stamped_output_path, index=False)
+    metrics.inc("rows_total", len(out_df))
+    metrics.inc("rows_failed_total", failed)
+    write_run_report(stamped_output_path, run={
+        "command": "process",
+        "input": input_path,
+        "output": stamped_output_path,
+        "rows": len(out_df),
+        "rows_failed": failed,
+        "processes": processes,
+        "wall_seconds": time.perf_counter() - run_start,
+    })
     return len(out_df), stamped_output_path
+
+
+def process_files(
+    input_paths: Sequence[str],
+    output_path: str,
+    text_column: str,
+    processes: Optional[int] = None,
+    profile_dir: Optional[str] = None,
+) -> Tuple[int, str]:
+    """Process several Excel files of comments as one run on a single worker pool.
+
+    Rows of all files are scheduled together (longest first across files), so the pool
+    stays busy across file boundaries, and rows repeating the text of a row in any file
+    are sent once. Each file's output is written as soon as its last row completes, as
+    `<input name>_processed_<stamp>.xlsx` next to `output_path`; `output_path` receives the
+    combined dataset with a `source_file` column, ready for `cluster`.
+
+    Args:
+        input_paths: Input Excel files (see `expand_inputs`).
+        output_path: Path to write the combined results Excel.
+        text_column: Column name containing the comment text in every file.
+        processes: Max worker processes for parallelism.
+        profile_dir: When set, pool workers write cProfile/tracemalloc data here.
+
+    Returns:
+        (row_count, combined_output_path)
+    """
+    from tqdm import tqdm
+
+    metrics.reset()
+    run_start = time.perf_counter()
+    frames, comments, offsets = read_batch(input_paths, text_column)
+    labels = batch_labels(input_paths)
+    file_outputs = batch_output_paths(output_path, labels)
+
+    results: List[Optional[ResultRecord]] = [None] * len(comments)
+    remaining = [offsets[i + 1] - offsets[i] for i in range(len(frames))]
+    failed = [0] * len(frames)
+    outputs: List[Any] = [None] * len(frames)
+    files: List[Dict[str, Any]] = [{} for _ in frames]
+
+    def finish_file(i: int) -> None:
+        lo, hi = offsets[i], offsets[i + 1]
+        outputs[i] = build_output_frame(frames[i], results[lo:hi], comments[lo:hi])
+        path = write_output(outputs[i], file_outputs[i])
+        files[i] = {"input": input_paths[i], "output": path, "rows": hi - lo, "rows_failed": failed[i]}
+        logger.info("Finished %s (%s rows) -> %s", labels[i], hi - lo, path)
+
+    for i, n in enumerate(remaining):
+        if not n:
+            finish_file(i)
+    with make_executor(processes, profile_dir) as ex:
+        workers = processes or os.cpu_count() or 1
+        rows = iter_results(comments, ex, max_inflight=workers * 4)
+        for idx, result, error in tqdm(rows, total=len(comments), desc=f"Processing {len(frames)} files"):
+            results[idx] = result
+            i = bisect.bisect_right(offsets, idx) - 1
+            failed[i] += error is not None
+            remaining[i] -= 1
+            if not remaining[i]:
+                finish_file(i)
+
+    combined = combine_outputs(labels, outputs)
+    stamped_output_path = write_output(combined, output_path)
+
+    metrics.inc("rows_total", len(combined))
+    metrics.inc("rows_failed_total", sum(failed))
+    write_run_report(stamped_output_path, run={
+        "command": "process",
+        "inputs": list(input_paths),
+        "output": stamped_output_path,
+        "files": files,
+        "rows": len(combined),
+        "rows_failed": sum(failed),
+        "processes": processes,
+        "wall_seconds": time.perf_counter() - run_start,
+    })
+    return len(combined), stamped_output_path
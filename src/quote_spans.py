@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import bisect
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from src.records import VERDICTS, ResultRecord, has_result
+from src.utils.metrics import metrics
+
+
+_WS_RUN = re.compile(r"\s\s+")
+REDACTION_MASK = "[REDACTED]"
+# Rows with at least this many distinct quotes are scanned once by the batch automaton;
+# below it, one `str.find` pass per quote is faster (measured on 1-15k character comments)
+AUTOMATON_MIN_QUOTES = 16
+
+
+def _lower(text: str) -> str:
+    """Lowercase `text` keeping its length (the few characters that expand when lowered are kept as-is)."""
+    low = text.lower()
+    if len(low) == len(text):
+        return low
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+def normalize_quote(quote: str) -> str:
+    """Case- and whitespace-insensitive form of a quote, as matched against comments."""
+    return " ".join(_lower(quote).split())
+
+
+class _Normalized:
+    """A comment lowercased with whitespace runs collapsed, mapping offsets back to the original."""
+
+    __slots__ = ("text", "_breaks", "_shifts")
+
+    def __init__(self, text: str) -> None:
+        self.text = " ".join(_lower(text).split())
+        self._breaks: List[int] = []
+        self._shifts: List[int] = []
+        if len(self.text) == len(text):
+            return
+        # Leading whitespace and inner runs of 2+ characters shift offsets; record where
+        shift = len(text) - len(text.lstrip())
+        if shift:
+            self._breaks.append(0)
+            self._shifts.append(shift)
+        for m in _WS_RUN.finditer(text, shift):
+            shift += m.end() - m.start() - 1
+            self._breaks.append(m.end() - shift)
+            self._shifts.append(shift)
+
+    def original(self, pos: int) -> int:
+        """Offset in the original comment of normalized offset `pos`."""
+        i = bisect.bisect_right(self._breaks, pos)
+        return pos + (self._shifts[i - 1] if i else 0)
+
+    def span(self, start: int, end: int) -> Tuple[int, int]:
+        """Original `[start, end)` span of a normalized span."""
+        return self.original(start), self.original(end - 1) + 1
+
+
+def _automaton(needles: Set[str]) -> Any:
+    """An Aho-Corasick automaton over `needles` when `pyahocorasick` is installed, else None."""
+    try:
+        import ahocorasick
+    except ImportError:
+        return None
+    automaton = ahocorasick.Automaton()
+    for needle in needles:
+        automaton.add_word(needle, len(needle))
+    automaton.make_automaton()
+    return automaton
+
+
+def _find_all(haystack: str, needle: str) -> Iterator[int]:
+    start = haystack.find(needle)
+    while start != -1:
+        yield start
+        start = haystack.find(needle, start + 1)
+
+
+def _matches(norm: str, wanted: Set[str], automaton: Any) -> Dict[str, List[int]]:
+    """Normalized start offsets of every occurrence of each wanted quote in `norm`."""
+    found: Dict[str, List[int]] = {}
+    if automaton is not None and len(wanted) >= AUTOMATON_MIN_QUOTES:
+        # One pass over the comment; the batch automaton also reports other rows' quotes
+        for end, length in automaton.iter(norm):
+            needle = norm[end - length + 1:end + 1]
+            if needle in wanted:
+                found.setdefault(needle, []).append(end - length + 1)
+    else:
+        for needle in wanted:
+            starts = list(_find_all(norm, needle))
+            if starts:
+                found[needle] = starts
+    return found
+
+
+def _merge(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def redact(text: str, spans: List[Tuple[int, int]], mask: str = REDACTION_MASK) -> str:
+    """Replace each (merged) span of `text` with `mask`."""
+    parts: List[str] = []
+    last = 0
+    for start, end in _merge(spans):
+        parts.append(text[last:start])
+        parts.append(mask)
+        last = end
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+def _spans_json(spans: List[Tuple[str, int, int]]) -> str:
+    """Same output as `json.dumps` of the span dicts (categories are plain identifiers)."""
+    return "[" + ", ".join(
+        f'{{"category": "{prefix}", "start": {start}, "end": {end}}}' for prefix, start, end in spans
+    ) + "]"
+
+
+def locate_quotes(
+    comments: Sequence[str], records: Sequence[Optional[ResultRecord]]
+) -> Dict[str, List[Optional[str]]]:
+    """Find the Task One quotes of each row in its comment and build the span columns.
+
+    Quotes are matched ignoring case and whitespace differences, and every occurrence
+    counts. A row with many quotes (`AUTOMATON_MIN_QUOTES`) is scanned once by an
+    Aho-Corasick automaton built over all of the batch's quotes; the usual handful of
+    quotes per row is searched directly, which is faster. Without `pyahocorasick`
+    installed every row is searched directly.
+
+    Returns three columns: `quote_spans` (JSON list of `{"category", "start", "end"}`
+    character offsets into the original comment), `redacted_comment` (the comment with
+    every span masked) and `unmatched_quotes` (JSON list of `{"category", "quote"}` quotes
+    not found in the comment, i.e. likely hallucinated). Rows without a record, or
+    failed rows, stay blank.
+    """
+    wanted_by_row: List[Optional[List[Tuple[str, str, str]]]] = []
+    needles: Set[str] = set()
+    for record in records:
+        if not has_result(record):
+            wanted_by_row.append(None)
+            continue
+        wanted = [
+            (prefix, quote, norm)
+            for (prefix, _), quotes in zip(VERDICTS, record.quotes)
+            for quote in quotes
+            for norm in (normalize_quote(quote),)
+            if norm
+        ]
+        needles.update(norm for _, _, norm in wanted)
+        wanted_by_row.append(wanted)
+    many = any(len({norm for _, _, norm in w}) >= AUTOMATON_MIN_QUOTES for w in wanted_by_row if w)
+    automaton = _automaton(needles) if many else None
+
+    spans_col: List[Optional[str]] = []
+    redacted_col: List[Optional[str]] = []
+    unmatched_col: List[Optional[str]] = []
+    quotes_total = unmatched_total = 0
+    for text, wanted in zip(comments, wanted_by_row):
+        if wanted is None:
+            spans_col.append(None)
+            redacted_col.append(None)
+            unmatched_col.append(None)
+            continue
+        text = text or ""
+        spans: List[Tuple[str, int, int]] = []
+        unmatched: List[Dict[str, str]] = []
+        if wanted:
+            normalized = _Normalized(text)
+            found = _matches(normalized.text, {norm for _, _, norm in wanted}, automaton)
+            for prefix, quote, norm in wanted:
+                if norm not in found:
+                    unmatched.append({"category": prefix, "quote": quote})
+                    continue
+                for start in found[norm]:
+                    spans.append((prefix, *normalized.span(start, start + len(norm))))
+        quotes_total += len(wanted)
+        unmatched_total += len(unmatched)
+        spans_col.append(_spans_json(spans))
+        redacted_col.append(redact(text, [(s, e) for _, s, e in spans]) if spans else text)
+        unmatched_col.append(json.dumps(unmatched, ensure_ascii=False) if unmatched else "[]")
+
+    metrics.inc("quotes_total", quotes_total)
+    metrics.inc("quotes_unmatched_total", unmatched_total)
+    return {"quote_spans": spans_col, "redacted_comment": redacted_col, "unmatched_quotes": unmatched_col}
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+from json.encoder import encode_basestring
+from enum import IntEnum, IntFlag
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class Verdict(IntFlag):
+    """Task One verdicts packed into one small integer."""
+
+    PII = 1
+    THIRD_PTY_INFO = 2
+    SSA_EMPLOYEE = 4
+    OFFENSIVE_LANG = 8
+
+
+class Opinion(IntEnum):
+    """Task Two overall opinion."""
+
+    UNKNOWN = 0
+    SUPPORT = 1
+    OPPOSE = 2
+
+
+# Output column prefix per verdict, in output column order
+VERDICTS: Tuple[Tuple[str, Verdict], ...] = (
+    ("pii", Verdict.PII),
+    ("third_pty_info", Verdict.THIRD_PTY_INFO),
+    ("ssa_employee", Verdict.SSA_EMPLOYEE),
+    ("offensive_lang", Verdict.OFFENSIVE_LANG),
+)
+_OPINIONS = {o.name.lower(): o for o in Opinion}
+_EMPTY: Tuple[str, ...] = ()
+
+
+class ResultRecord:
+    """Compact result of one comment: verdict bitflags, opinion enum and tuples of strings.
+
+    Pickles as a flat tuple (see `__reduce__`), so results cross the process boundary
+    with far less overhead than a dict of "True"/"False" strings and lists. Convert with
+    `from_dict`/`to_dict` where the task-level dict form is needed (caching, storage).
+    """
+
+    __slots__ = ("flags", "opinion", "quotes", "themes", "error")
+
+    def __init__(
+        self,
+        flags: int = 0,
+        opinion: int = Opinion.UNKNOWN,
+        quotes: Tuple[Tuple[str, ...], ...] = (_EMPTY,) * len(VERDICTS),
+        themes: Tuple[str, ...] = _EMPTY,
+        error: Optional[str] = None,
+    ) -> None:
+        self.flags = int(flags)
+        self.opinion = int(opinion)
+        self.quotes = quotes
+        self.themes = themes
+        self.error = error
+
+    def __reduce__(self) -> Tuple[Any, ...]:
+        return (ResultRecord, (self.flags, self.opinion, self.quotes, self.themes, self.error))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ResultRecord) and self.__reduce__() == other.__reduce__()
+
+    def __repr__(self) -> str:
+        return (f"ResultRecord(flags={Verdict(self.flags)!r}, opinion={Opinion(self.opinion).name}, "
+                f"themes={self.themes!r}, error={self.error!r})")
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "ResultRecord":
+        """Build a record from the merged Task One/Two dict (`pii_ver`, `pii_txt`, ..., `themes`)."""
+        flags = 0
+        quotes: List[Tuple[str, ...]] = []
+        for prefix, bit in VERDICTS:
+            if str(d.get(f"{prefix}_ver", "False")) == "True":
+                flags |= bit
+            quotes.append(tuple(d.get(f"{prefix}_txt") or _EMPTY))
+        opinion = _OPINIONS.get(str(d.get("overall_opinion", "unknown")), Opinion.UNKNOWN)
+        return cls(flags, opinion, tuple(quotes), tuple(d.get("themes") or _EMPTY), d.get("processing_error"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the merged Task One/Two dict form of this record."""
+        out: Dict[str, Any] = {}
+        for (prefix, bit), quotes in zip(VERDICTS, self.quotes):
+            out[f"{prefix}_ver"] = "True" if self.flags & bit else "False"
+            out[f"{prefix}_txt"] = list(quotes)
+        out["overall_opinion"] = Opinion(self.opinion).name.lower()
+        out["themes"] = list(self.themes)
+        out["processing_error"] = self.error
+        return out
+
+
+def _json_list(values: Tuple[str, ...]) -> str:
+    """Same output as `json.dumps(list(values), ensure_ascii=False)`, without the encoder setup per call."""
+    if not values:
+        return "[]"
+    return "[" + ", ".join(map(encode_basestring, values)) + "]"
+
+
+def has_result(record: Optional[ResultRecord]) -> bool:
+    """True when a row has real results: a record that is not a failure placeholder."""
+    return record is not None and record.error is None
+
+
+def output_columns(records: Sequence[Optional[ResultRecord]]) -> Dict[str, List[Any]]:
+    """Build the output columns for `records` in bulk.
+
+    Verdicts become "True"/"False", the opinion its lowercase name and quote/theme lists
+    JSON strings, matching the spreadsheet format reviewers already use. Rows without a
+    record, and failed rows, leave every result cell blank so they cannot be mistaken for
+    "False" verdicts; failed rows carry the reason in `processing_error`.
+    """
+    import numpy as np
+
+    n = len(records)
+    present = np.fromiter((has_result(r) for r in records), dtype=bool, count=n)
+    flags = np.fromiter((r.flags if r is not None else 0 for r in records), dtype=np.uint8, count=n)
+    opinions = np.fromiter((r.opinion if r is not None else 0 for r in records), dtype=np.uint8, count=n)
+
+    def blank_missing(values: "np.ndarray") -> List[Any]:
+        values = values.astype(object)
+        values[~present] = None
+        return values.tolist()
+
+    bools = np.array(["False", "True"], dtype=object)
+    cols: Dict[str, List[Any]] = {}
+    for prefix, bit in VERDICTS:
+        cols[f"{prefix}_ver"] = blank_missing(bools[((flags & int(bit)) != 0).astype(np.intp)])
+    names = np.array([o.name.lower() for o in Opinion], dtype=object)
+    cols["overall_opinion"] = blank_missing(names[opinions])
+    cols["processing_error"] = [r.error if r is not None else None for r in records]
+    for i, (prefix, _) in enumerate(VERDICTS):
+        cols[f"{prefix}_txt"] = [_json_list(r.quotes[i]) if has_result(r) else None for r in records]
+    cols["themes"] = [_json_list(r.themes) if has_result(r) else None for r in records]
+    return cols
+
+
+def assign_columns(df: "pd.DataFrame", records: Sequence[Optional[ResultRecord]]) -> "pd.DataFrame":
+    """Return a copy of `df` with the result columns added in one bulk assignment."""
+    import pandas as pd
+
+    cols = output_columns(records)
+    out = df.copy()
+    # Columns already in the input (e.g. a re-processed results file) are overwritten in place
+    for col in [c for c in cols if c in out.columns]:
+        out[col] = cols.pop(col)
+    return pd.concat([out, pd.DataFrame(cols, index=df.index)], axis=1)
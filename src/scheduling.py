@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import os
+from typing import Dict, List, Sequence, Tuple
+
+
+# Rough chars-per-token ratio for English prose with GPT tokenizers
+CHARS_PER_TOKEN = 4
+
+# Completion budget per task: (base tokens for the JSON skeleton, tokens per input token)
+_COMPLETION_BUDGETS: Dict[str, Tuple[int, float]] = {
+    # Quotes are copied out of the comment, so the budget grows with its length
+    "task_one": (160, 0.5),
+    # Themes are a handful of short phrases regardless of length
+    "task_two": (120, 0.08),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for scheduling and budgeting (~4 characters per token)."""
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def lpt_order(token_counts: Sequence[int]) -> List[int]:
+    """Return row indices longest-first (LPT scheduling); ties keep row order.
+
+    Dispatching the slowest rows first keeps a handful of long comments from landing at
+    the end of a run, where they would run alone on an otherwise idle pool.
+    """
+    return sorted(range(len(token_counts)), key=lambda i: -token_counts[i])
+
+
+def max_tokens_for(task: str, comment_tokens: int) -> int:
+    """Size the completion `max_tokens` for a task from the comment's estimated length.
+
+    Short comments reserve far less quota under tokens-per-minute accounting; the result
+    never exceeds `LLM_MAX_TOKENS_CAP` (default 700, the previous fixed value).
+    """
+    base, per_token = _COMPLETION_BUDGETS[task]
+    cap = int(os.getenv("LLM_MAX_TOKENS_CAP", "700") or 700)
+    return int(min(cap, base + per_token * comment_tokens))
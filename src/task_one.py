@@ -4,8 +4,12 @@ import json
 from pathlib import Path
 from typing import Dict, Any, List
 
+from src.cache import cached
 from src.llm.azure_openai_client import chat_json
+from src.llm.schemas import TASK_ONE_SCHEMA
+from src.scheduling import estimate_tokens, max_tokens_for
 from src.utils.logging import get_logger
+from src.utils.metrics import metrics
 
 
 logger = get_logger(__name__)
@@ -58,7 +62,34 @@ def review_comment_for_redactions(comment: str) -> Dict[str, Any]:
     messages = [
         {"role": "user", "content": f"Comment:\n{comment}\n\nReturn ONLY the JSON as specified."}
     ]
-    raw = chat_json(messages, system=system)
-    result = _coerce_result(raw or {})
+    raw = cached("task_one", [system, comment], lambda: chat_json(
+        messages, system=system, max_tokens=max_tokens_for("task_one", estimate_tokens(comment)),
+        schema=TASK_ONE_SCHEMA,
+    ))
+    with metrics.stage("coerce"):
+        result = _coerce_result(raw or {})
     logger.debug("Task One result: %s", json.dumps(result))
     return result
+
+
+def merge_chunk_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine Task One results for the chunks of one long comment.
+
+    A verdict is "True" if any chunk flagged it; quote lists are unioned in chunk order
+    with duplicates (e.g. from chunk overlap) removed.
+    """
+    out: Dict[str, Any] = {}
+    for v_key, t_key in [
+        ("pii_ver", "pii_txt"),
+        ("third_pty_info_ver", "third_pty_info_txt"),
+        ("ssa_employee_ver", "ssa_employee_txt"),
+        ("offensive_lang_ver", "offensive_lang_txt"),
+    ]:
+        out[v_key] = "True" if any(r.get(v_key) == "True" for r in results) else "False"
+        quotes: List[str] = []
+        for r in results:
+            for q in r.get(t_key, []):
+                if q not in quotes:
+                    quotes.append(q)
+        out[t_key] = quotes
+    return out
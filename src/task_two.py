@@ -4,16 +4,20 @@ import json
 from pathlib import Path
 from typing import Dict, Any, List
 
-from src.llm.azure_openai_client import chat_json
+from src.cache import cached
+from src.llm.azure_openai_client import InvalidResponseError, chat_json
+from src.llm.schemas import TASK_TWO_SCHEMA
+from src.scheduling import estimate_tokens, max_tokens_for
 from src.utils.logging import get_logger
+from src.utils.metrics import metrics
 
 
 logger = get_logger(__name__)
 
 
-def _load_prompt() -> str:
-    """Load the Task Two system prompt from `src/prompts/task_two_prompt.txt`."""
-    prompt_path = Path(__file__).resolve().parent / "prompts" / "task_two_prompt.txt"
+def _load_prompt(name: str = "task_two_prompt.txt") -> str:
+    """Load a Task Two system prompt from `src/prompts/` (the main prompt by default)."""
+    prompt_path = Path(__file__).resolve().parent / "prompts" / name
     return prompt_path.read_text(encoding="utf-8")
 
 
@@ -57,7 +61,61 @@ def extract_themes(comment: str) -> Dict[str, Any]:
     messages = [
         {"role": "user", "content": f"Comment:\n{comment}\n\nReturn ONLY the JSON as specified."}
     ]
-    raw = chat_json(messages, system=system)
-    result = _coerce_result(raw or {})
+    raw = cached("task_two", [system, comment], lambda: chat_json(
+        messages, system=system, max_tokens=max_tokens_for("task_two", estimate_tokens(comment)),
+        schema=TASK_TWO_SCHEMA,
+    ))
+    with metrics.stage("coerce"):
+        result = _coerce_result(raw or {})
     logger.debug("Task Two result: %s", json.dumps(result))
     return result
+
+
+def _theme_key(theme: str) -> str:
+    """Normalize a theme for de-duplication (case and whitespace insensitive)."""
+    return " ".join(theme.lower().split())
+
+
+def reduce_themes(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine Task Two results for the chunks of one long comment with one final call.
+
+    Chunk themes are merged and de-duplicated locally, then the model consolidates them
+    into the comment's distinct themes and overall opinion. If that call yields nothing
+    usable, the merged list is kept and the opinion is the chunks' shared one (else
+    "unknown").
+    """
+    merged: List[str] = []
+    seen = set()
+    for r in results:
+        for t in r.get("themes", []):
+            key = _theme_key(t)
+            if key and key not in seen:
+                seen.add(key)
+                merged.append(t)
+    opinions = [r.get("overall_opinion", "unknown") for r in results]
+    known = {o for o in opinions if o != "unknown"}
+    fallback = {"themes": merged, "overall_opinion": known.pop() if len(known) == 1 else "unknown"}
+    if not merged and not known:
+        return fallback
+
+    system = _load_prompt("task_two_reduce_prompt.txt")
+    payload = json.dumps({"part_opinions": opinions, "themes": merged}, ensure_ascii=False)
+    messages = [
+        {"role": "user", "content": f"Parts:\n{payload}\n\nReturn ONLY the JSON as specified."}
+    ]
+    try:
+        raw = cached("task_two_reduce", [system, payload], lambda: chat_json(
+            messages, system=system, max_tokens=max_tokens_for("task_two", estimate_tokens(payload)),
+            schema=TASK_TWO_SCHEMA,
+        ))
+    except InvalidResponseError as e:
+        logger.warning("Theme reduce failed, keeping merged chunk themes: %s", e)
+        return fallback
+    if not raw:
+        return fallback
+    with metrics.stage("coerce"):
+        result = _coerce_result(raw)
+    if not result["themes"]:
+        result["themes"] = merged
+    logger.debug("Task Two reduced result: %s", json.dumps(result))
+    return result
@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# Upper bounds (seconds) for latency histograms; the last bucket is +Inf
+LATENCY_BUCKETS: Tuple[float, ...] = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _key(name: str, labels: Dict[str, Any]) -> str:
+    """Render a metric name plus labels as a Prometheus-style series key."""
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{labels[k]}"' for k in sorted(labels))
+    return f"{name}{{{inner}}}"
+
+
+class Metrics:
+    """Thread-safe in-process registry of counters, stage timers and latency histograms.
+
+    Each process (including pool workers) has its own registry. Workers `drain()` their
+    registry and ship the plain-dict snapshot back with each result, and the parent
+    `merge()`s it, so the parent holds the totals for the whole run.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._stages: Dict[str, Dict[str, float]] = {}
+        self._histograms: Dict[str, Dict[str, Any]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Increment a counter."""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        """Record one latency observation in a histogram."""
+        key = _key(name, labels)
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "sum": 0.0, "count": 0}
+                self._histograms[key] = h
+            idx = next((i for i, b in enumerate(LATENCY_BUCKETS) if seconds <= b), len(LATENCY_BUCKETS))
+            h["buckets"][idx] += 1
+            h["sum"] += seconds
+            h["count"] += 1
+
+    def add_stage_time(self, stage: str, seconds: float, calls: int = 1) -> None:
+        """Accumulate wall time spent in a pipeline stage."""
+        with self._lock:
+            s = self._stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+            s["seconds"] += seconds
+            s["calls"] += calls
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as pipeline stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-safe copy of all metrics."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "stages": {k: dict(v) for k, v in self._stages.items()},
+                "histograms": {
+                    k: {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"]}
+                    for k, v in self._histograms.items()
+                },
+            }
+
+    def drain(self) -> Dict[str, Any]:
+        """Return a snapshot and reset the registry (used by workers between tasks)."""
+        snap = self.snapshot()
+        self.reset()
+        return snap
+
+    def reset(self) -> None:
+        """Clear all metrics."""
+        with self._lock:
+            self._counters.clear()
+            self._stages.clear()
+            self._histograms.clear()
+
+    def merge(self, snap: Optional[Dict[str, Any]]) -> None:
+        """Add a snapshot (e.g. from a worker) into this registry."""
+        if not snap:
+            return
+        with self._lock:
+            for k, v in snap.get("counters", {}).items():
+                self._counters[k] = self._counters.get(k, 0) + v
+            for k, v in snap.get("stages", {}).items():
+                s = self._stages.setdefault(k, {"seconds": 0.0, "calls": 0})
+                s["seconds"] += v.get("seconds", 0.0)
+                s["calls"] += v.get("calls", 0)
+            for k, v in snap.get("histograms", {}).items():
+                h = self._histograms.setdefault(
+                    k, {"buckets": [0] * (len(LATENCY_BUCKETS) + 1), "sum": 0.0, "count": 0}
+                )
+                h["buckets"] = [a + b for a, b in zip(h["buckets"], v.get("buckets", []))]
+                h["sum"] += v.get("sum", 0.0)
+                h["count"] += v.get("count", 0)
+
+    def to_prometheus(self) -> str:
+        """Render the registry in the Prometheus text exposition format."""
+        snap = self.snapshot()
+        lines: List[str] = []
+        for k, v in sorted(snap["counters"].items()):
+            lines.append(f"{k} {v}")
+        for stage, v in sorted(snap["stages"].items()):
+            lines.append(f'stage_seconds_total{{stage="{stage}"}} {v["seconds"]}')
+            lines.append(f'stage_calls_total{{stage="{stage}"}} {v["calls"]}')
+        for k, h in sorted(snap["histograms"].items()):
+            name, _, labels = k.partition("{")
+            labels = labels.rstrip("}")
+            sep = "," if labels else ""
+            cumulative = 0
+            for bound, n in zip(list(LATENCY_BUCKETS) + ["+Inf"], h["buckets"]):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{name}_sum{suffix} {h['sum']}")
+            lines.append(f"{name}_count{suffix} {h['count']}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def _price(env_name: str) -> float:
+    """Read a USD-per-1K-token price from the environment (0 when unset)."""
+    try:
+        return float(os.getenv(env_name, "0") or 0)
+    except ValueError:
+        return 0.0
+
+
+def _sum_counter(counters: Dict[str, float], name: str, **labels: Any) -> float:
+    """Sum all series of counter `name` whose labels include `labels`."""
+    total = 0.0
+    wanted = [f'{k}="{v}"' for k, v in labels.items()]
+    for key, val in counters.items():
+        if key == name or key.startswith(name + "{"):
+            if all(w in key for w in wanted):
+                total += val
+    return total
+
+
+def _label_values(counters: Dict[str, float], name: str, label: str) -> List[str]:
+    """Return the distinct values of `label` across the series of counter `name`."""
+    values = set()
+    needle = f'{label}="'
+    for key in counters:
+        if key.startswith(name + "{") and needle in key:
+            values.add(key.split(needle, 1)[1].split('"', 1)[0])
+    return sorted(values)
+
+
+def summarize(snap: Dict[str, Any]) -> Dict[str, Any]:
+    """Derive token totals, estimated cost and latency percentiles from a snapshot.
+
+    Prices come from `AZURE_OPENAI_PROMPT_PRICE_PER_1K`, `AZURE_OPENAI_COMPLETION_PRICE_PER_1K`
+    and `AZURE_OPENAI_EMBEDDING_PRICE_PER_1K` (USD per 1K tokens, default 0).
+    """
+    c = snap.get("counters", {})
+    tokens = {
+        "chat_prompt": int(_sum_counter(c, "llm_prompt_tokens_total", kind="chat")),
+        "chat_completion": int(_sum_counter(c, "llm_completion_tokens_total", kind="chat")),
+        "embedding": int(_sum_counter(c, "llm_prompt_tokens_total", kind="embedding")),
+    }
+    cost = {
+        "chat_prompt": tokens["chat_prompt"] / 1000 * _price("AZURE_OPENAI_PROMPT_PRICE_PER_1K"),
+        "chat_completion": tokens["chat_completion"] / 1000 * _price("AZURE_OPENAI_COMPLETION_PRICE_PER_1K"),
+        "embedding": tokens["embedding"] / 1000 * _price("AZURE_OPENAI_EMBEDDING_PRICE_PER_1K"),
+    }
+    cost["total"] = sum(cost.values())
+
+    latency: Dict[str, Dict[str, float]] = {}
+    for key, h in snap.get("histograms", {}).items():
+        if not h.get("count"):
+            continue
+        pct: Dict[str, float] = {"count": h["count"], "mean": h["sum"] / h["count"]}
+        for q in (0.5, 0.9, 0.99):
+            target = q * h["count"]
+            cumulative = 0
+            for bound, n in zip(list(LATENCY_BUCKETS) + [float("inf")], h["buckets"]):
+                cumulative += n
+                if cumulative >= target:
+                    pct[f"p{int(q * 100)}_le"] = bound
+                    break
+        latency[key] = pct
+
+    backends: Dict[str, Dict[str, Any]] = {}
+    names = set(_label_values(c, "llm_backend_requests_total", "backend"))
+    names.update(_label_values(c, "llm_backend_ejections_total", "backend"))
+    for name in sorted(names):
+        hist = snap.get("histograms", {}).get(_key("llm_backend_latency_seconds", {"backend": name}), {})
+        backends[name] = {
+            "requests": int(_sum_counter(c, "llm_backend_requests_total", backend=name)),
+            "errors": int(_sum_counter(c, "llm_backend_errors_total", backend=name)),
+            "rate_limited_429": int(_sum_counter(c, "llm_backend_rate_limited_total", backend=name)),
+            "ejections": int(_sum_counter(c, "llm_backend_ejections_total", backend=name)),
+            "mean_latency_seconds": hist["sum"] / hist["count"] if hist.get("count") else None,
+        }
+
+    responses = _sum_counter(c, "llm_responses_total")
+    parse_failures = _sum_counter(c, "llm_parse_failures_total")
+    responses_summary = {
+        "total": int(responses),
+        "invalid_first_try": int(parse_failures),
+        "parse_failure_rate": parse_failures / responses if responses else 0.0,
+        "repaired_local": int(_sum_counter(c, "llm_repairs_total", method="local")),
+        "repaired_followup": int(_sum_counter(c, "llm_repairs_total", method="followup")),
+        "full_retries": int(_sum_counter(c, "llm_repairs_total", method="full_retry")),
+        "unrepaired": int(_sum_counter(c, "llm_invalid_responses_total")),
+    }
+
+    quotes = _sum_counter(c, "quotes_total")
+    unmatched = _sum_counter(c, "quotes_unmatched_total")
+    quotes_summary = {
+        "total": int(quotes),
+        "unmatched": int(unmatched),
+        "unmatched_rate": unmatched / quotes if quotes else 0.0,
+    }
+
+    return {
+        "tokens": tokens,
+        "estimated_cost_usd": cost,
+        "llm_calls": int(_sum_counter(c, "llm_calls_total")),
+        "retries": int(_sum_counter(c, "llm_retries_total")),
+        "rate_limited_429": int(_sum_counter(c, "llm_rate_limited_total")),
+        "responses": responses_summary,
+        "quotes": quotes_summary,
+        "latency": latency,
+        "backends": backends,
+    }
+
+
+def report_paths(output_path: str) -> Tuple[str, str]:
+    """Return the JSON and CSV run report paths next to an output file."""
+    base, _ = os.path.splitext(output_path)
+    return f"{base}.run_report.json", f"{base}.run_report.csv"
+
+
+def write_run_report(output_path: str, run: Dict[str, Any], registry: Optional[Metrics] = None) -> Tuple[str, str]:
+    """Write the run report (JSON plus a flat metric,value CSV) next to `output_path`.
+
+    Args:
+        output_path: The run's main output file; reports are written alongside it.
+        run: Run-level facts (command, input, rows, wall time, ...).
+        registry: Metrics to report; defaults to the process-wide registry.
+    """
+    snap = (registry or metrics).snapshot()
+    report = {
+        "run": {"generated_at": datetime.now().isoformat(timespec="seconds"), **run},
+        "summary": summarize(snap),
+        **snap,
+    }
+    json_path, csv_path = report_paths(output_path)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    rows: List[Tuple[str, Any]] = []
+
+    def flatten(prefix: str, val: Any) -> None:
+        if isinstance(val, dict):
+            for k, v in val.items():
+                flatten(f"{prefix}.{k}" if prefix else str(k), v)
+        elif isinstance(val, list):
+            rows.append((prefix, json.dumps(val)))
+        else:
+            rows.append((prefix, val))
+
+    flatten("", report)
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["metric", "value"])
+        writer.writerows(rows)
+    logger.info("Run report -> %s", json_path)
+    return json_path, csv_path
+
+
+def start_metrics_server(port: int, registry: Optional[Metrics] = None) -> ThreadingHTTPServer:
+    """Serve the registry as Prometheus text on `http://127.0.0.1:<port>/metrics` (daemon thread)."""
+    reg = registry or metrics
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802 (http.server naming)
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = reg.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            return
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving metrics on http://127.0.0.1:%s/metrics", port)
+    return server
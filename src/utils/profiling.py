@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import cProfile
+import glob
+import io
+import json
+import os
+import pstats
+import tracemalloc
+from multiprocessing import util as mp_util
+from typing import Any, Dict, List, Optional
+
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+_TRACE_FRAMES = 10
+
+
+def profile_dir_for(output_path: str) -> str:
+    """Return the directory holding profile artifacts for an output file."""
+    base, _ = os.path.splitext(output_path)
+    return f"{base}.profile"
+
+
+def _memory_top(snapshot: tracemalloc.Snapshot, limit: int = 10) -> List[Dict[str, Any]]:
+    """Summarize the largest allocation sites in a tracemalloc snapshot."""
+    out = []
+    for stat in snapshot.statistics("lineno")[:limit]:
+        frame = stat.traceback[0]
+        out.append({"site": f"{frame.filename}:{frame.lineno}", "size_kb": round(stat.size / 1024, 1), "count": stat.count})
+    return out
+
+
+def _dump_worker(profiler: cProfile.Profile, profile_dir: str) -> None:
+    """Write this worker's cProfile stats and tracemalloc peak at process exit."""
+    profiler.disable()
+    pid = os.getpid()
+    profiler.dump_stats(os.path.join(profile_dir, f"worker-{pid}.prof"))
+    current, peak = tracemalloc.get_traced_memory()
+    mem = {"pid": pid, "current_kb": round(current / 1024, 1), "peak_kb": round(peak / 1024, 1),
+           "top": _memory_top(tracemalloc.take_snapshot())}
+    tracemalloc.stop()
+    with open(os.path.join(profile_dir, f"worker-{pid}.mem.json"), "w", encoding="utf-8") as f:
+        json.dump(mem, f, indent=2)
+
+
+def init_worker_profiling(profile_dir: str) -> None:
+    """Pool initializer hook: profile this worker until it exits.
+
+    Stats are written from a multiprocessing finalizer, which pool workers run when they
+    shut down normally (atexit does not fire in forked workers).
+    """
+    tracemalloc.start(_TRACE_FRAMES)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    mp_util.Finalize(None, _dump_worker, args=(profiler, profile_dir), exitpriority=10)
+
+
+class RunProfiler:
+    """Context manager profiling a whole run: the main process plus any pool workers.
+
+    Pass `worker_dir` to the pool (see `init_worker_profiling`). On exit, main and worker
+    stats are merged into `<output>.profile/merged.prof`, a text report and memory JSON are
+    written alongside, and a top-N hot-spot summary is logged.
+    """
+
+    def __init__(self, output_path: str, top_n: int = 25) -> None:
+        self.output_dir = profile_dir_for(output_path)
+        self.worker_dir = os.path.join(self.output_dir, "workers")
+        self.top_n = top_n
+        self._profiler = cProfile.Profile()
+
+    def __enter__(self) -> "RunProfiler":
+        os.makedirs(self.worker_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(self.worker_dir, "worker-*")):
+            os.remove(stale)
+        tracemalloc.start(_TRACE_FRAMES)
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._profiler.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        main_top = _memory_top(tracemalloc.take_snapshot())
+        tracemalloc.stop()
+        try:
+            self._write(current, peak, main_top)
+        except Exception as e:
+            logger.warning("Failed to write profile artifacts: %s", e)
+
+    def _write(self, current: int, peak: int, main_top: List[Dict[str, Any]]) -> None:
+        main_prof = os.path.join(self.output_dir, "main.prof")
+        self._profiler.dump_stats(main_prof)
+        worker_profs = sorted(glob.glob(os.path.join(self.worker_dir, "worker-*.prof")))
+        stats = pstats.Stats(main_prof)
+        for wp in worker_profs:
+            stats.add(wp)
+        merged = os.path.join(self.output_dir, "merged.prof")
+        stats.dump_stats(merged)
+
+        workers_mem = []
+        for mp in sorted(glob.glob(os.path.join(self.worker_dir, "worker-*.mem.json"))):
+            with open(mp, "r", encoding="utf-8") as f:
+                workers_mem.append(json.load(f))
+        memory = {
+            "main": {"current_kb": round(current / 1024, 1), "peak_kb": round(peak / 1024, 1), "top": main_top},
+            "workers": workers_mem,
+        }
+        with open(os.path.join(self.output_dir, "memory.json"), "w", encoding="utf-8") as f:
+            json.dump(memory, f, indent=2)
+
+        buf = io.StringIO()
+        report = pstats.Stats(merged, stream=buf)
+        report.sort_stats("cumulative").print_stats(self.top_n)
+        report.sort_stats("tottime").print_stats(self.top_n)
+        with open(os.path.join(self.output_dir, "profile.txt"), "w", encoding="utf-8") as f:
+            f.write(buf.getvalue())
+
+        lines = [f"Top {self.top_n} hot spots by own time (main + {len(worker_profs)} workers):"]
+        rows = sorted(report.stats.items(), key=lambda kv: kv[1][2], reverse=True)[: self.top_n]  # type: ignore[attr-defined]
+        for (filename, lineno, func), (_cc, ncalls, tottime, cumtime, _callers) in rows:
+            where = f"{os.path.basename(filename)}:{lineno}({func})"
+            lines.append(f"  {tottime:9.3f}s own  {cumtime:9.3f}s cum  {ncalls:>9} calls  {where}")
+        worker_peak = max((w.get("peak_kb", 0) for w in workers_mem), default=0)
+        lines.append(f"Peak traced memory: main {memory['main']['peak_kb']:.0f} KB, max worker {worker_peak:.0f} KB")
+        lines.append(f"Profile artifacts -> {self.output_dir}")
+        logger.info("\n".join(lines))
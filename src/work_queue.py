@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.records import ResultRecord
+from src.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    text_column TEXT NOT NULL,
+    rows_total INTEGER NOT NULL,
+    shard_size INTEGER NOT NULL,
+    lease_seconds REAL NOT NULL,
+    max_attempts INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    result_path TEXT
+);
+CREATE TABLE IF NOT EXISTS shards (
+    run_id TEXT NOT NULL,
+    shard_id INTEGER NOT NULL,
+    start_row INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    lease_owner TEXT,
+    lease_token TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    metrics TEXT,
+    error TEXT,
+    finished_at REAL,
+    PRIMARY KEY (run_id, shard_id)
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT NOT NULL,
+    row_idx INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    error TEXT,
+    PRIMARY KEY (run_id, row_idx)
+);
+"""
+
+
+def default_queue_path() -> str:
+    """Return the queue database path (`WORK_QUEUE_PATH` env, default `data/queue/queue.sqlite`)."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.getenv("WORK_QUEUE_PATH", os.path.join(root, "data", "queue", "queue.sqlite"))
+
+
+def worker_id() -> str:
+    """Identify this worker process in leases (host and pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _fail_exhausted(conn: sqlite3.Connection, now: float) -> None:
+    """Fail expired leases whose attempts are used up instead of handing them out again."""
+    conn.execute(
+        "UPDATE shards SET status = 'failed', error = 'lease expired ' || attempts || ' times', finished_at = ?"
+        " WHERE status = 'leased' AND lease_expires < ?"
+        " AND attempts >= (SELECT max_attempts FROM runs WHERE runs.id = shards.run_id)",
+        (now, now),
+    )
+
+
+class WorkQueue:
+    """Durable queue of row shards shared by a coordinator and any number of workers.
+
+    Backed by one SQLite file, which may sit on shared storage. The rollback journal is
+    used rather than WAL because WAL needs shared memory that network filesystems do not
+    provide. Comment texts travel inside the shards, so workers need only the queue file,
+    not the input spreadsheet.
+
+    Workers `lease` a shard for `lease_seconds` and `renew` it while they work. A shard
+    whose lease expires (its worker crashed or hung) is handed to the next worker, up to
+    `max_attempts` times. `complete` commits a shard's results only while the caller
+    still holds the lease, in one transaction, so every row's result is written exactly
+    once even if a slow worker finishes after its shard was re-leased.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=60)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def create_run(
+        self,
+        input_path: str,
+        output_path: str,
+        text_column: str,
+        comments: List[str],
+        shard_size: int = 200,
+        lease_seconds: float = 300.0,
+        max_attempts: int = 3,
+    ) -> str:
+        """Enqueue a docket as shards of `shard_size` consecutive rows and return the run id."""
+        run_id = uuid.uuid4().hex[:12]
+        shard_size = max(1, shard_size)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT INTO runs (id, input_path, output_path, text_column, rows_total, shard_size, lease_seconds,"
+                " max_attempts, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, input_path, output_path, text_column, len(comments), shard_size, lease_seconds,
+                 max_attempts, time.time()),
+            )
+            conn.executemany(
+                "INSERT INTO shards (run_id, shard_id, start_row, payload) VALUES (?, ?, ?, ?)",
+                [
+                    (run_id, i, start, json.dumps(comments[start:start + shard_size], ensure_ascii=False))
+                    for i, start in enumerate(range(0, len(comments), shard_size))
+                ],
+            )
+        return run_id
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Return one run as a dict, or None."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return dict(row) if row else None
+
+    def lease(self, owner: str, run_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Lease the next queued (or expired) shard, oldest run first; None when nothing is available.
+
+        Returns the shard with its `lease_token`, `start_row` and decoded `comments`.
+        """
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            _fail_exhausted(conn, now)
+            query = (
+                "SELECT s.run_id, s.shard_id, s.start_row, s.payload, s.attempts, r.lease_seconds"
+                " FROM shards s JOIN runs r ON r.id = s.run_id"
+                " WHERE (s.status = 'queued' OR (s.status = 'leased' AND s.lease_expires < ?))"
+            )
+            params: List[Any] = [now]
+            if run_id:
+                query += " AND s.run_id = ?"
+                params.append(run_id)
+            row = conn.execute(query + " ORDER BY r.created_at, s.shard_id LIMIT 1", params).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE shards SET status = 'leased', lease_owner = ?, lease_token = ?, lease_expires = ?,"
+                " attempts = attempts + 1 WHERE run_id = ? AND shard_id = ?",
+                (owner, token, now + row["lease_seconds"], row["run_id"], row["shard_id"]),
+            )
+        if row["attempts"]:
+            logger.warning("Re-leasing shard %s/%s (attempt %s)", row["run_id"], row["shard_id"], row["attempts"] + 1)
+        return {
+            "run_id": row["run_id"],
+            "shard_id": row["shard_id"],
+            "start_row": row["start_row"],
+            "comments": json.loads(row["payload"]),
+            "lease_token": token,
+            "lease_seconds": row["lease_seconds"],
+        }
+
+    def renew(self, shard: Dict[str, Any]) -> bool:
+        """Extend a held lease; False means the lease was lost and the work should stop."""
+        with closing(self._connect()) as conn, conn:
+            cur = conn.execute(
+                "UPDATE shards SET lease_expires = ? WHERE run_id = ? AND shard_id = ? AND lease_token = ?"
+                " AND status = 'leased'",
+                (time.time() + shard["lease_seconds"], shard["run_id"], shard["shard_id"], shard["lease_token"]),
+            )
+        return cur.rowcount == 1
+
+    def complete(
+        self,
+        shard: Dict[str, Any],
+        rows: List[Tuple[int, ResultRecord, Optional[str]]],
+        snapshot: Optional[Dict[str, Any]] = None,
+    ) -> bool:
+        """Commit a shard's `(row_idx, result, error)` rows and metrics if the lease is still held.
+
+        Returns False (and writes nothing) when the lease was lost to another worker.
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(
+                "UPDATE shards SET status = 'done', finished_at = ?, metrics = ?, lease_expires = NULL"
+                " WHERE run_id = ? AND shard_id = ? AND lease_token = ? AND status = 'leased'",
+                (time.time(), json.dumps(snapshot or {}), shard["run_id"], shard["shard_id"], shard["lease_token"]),
+            )
+            if cur.rowcount != 1:
+                return False
+            conn.executemany(
+                "INSERT INTO results (run_id, row_idx, result, error) VALUES (?, ?, ?, ?)",
+                [(shard["run_id"], int(idx), json.dumps(result.to_dict(), ensure_ascii=False), err)
+                 for idx, result, err in rows],
+            )
+        return True
+
+    def release(self, shard: Dict[str, Any]) -> None:
+        """Give a leased shard back to the queue (e.g. on worker shutdown) without using an attempt."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "UPDATE shards SET status = 'queued', lease_owner = NULL, lease_token = NULL, lease_expires = NULL,"
+                " attempts = MAX(attempts - 1, 0) WHERE run_id = ? AND shard_id = ? AND lease_token = ?"
+                " AND status = 'leased'",
+                (shard["run_id"], shard["shard_id"], shard["lease_token"]),
+            )
+
+    def progress(self, run_id: str) -> Dict[str, int]:
+        """Return shard counts by status plus rows with stored results (failing exhausted shards first)."""
+        with closing(self._connect()) as conn, conn:
+            _fail_exhausted(conn, time.time())
+            counts = {r["status"]: r["n"] for r in conn.execute(
+                "SELECT status, COUNT(*) AS n FROM shards WHERE run_id = ? GROUP BY status", (run_id,)
+            )}
+            rows_done = conn.execute("SELECT COUNT(*) FROM results WHERE run_id = ?", (run_id,)).fetchone()[0]
+        return {"queued": counts.get("queued", 0), "leased": counts.get("leased", 0),
+                "done": counts.get("done", 0), "failed": counts.get("failed", 0), "rows_done": rows_done}
+
+    def results(self, run_id: str) -> Dict[int, Tuple[ResultRecord, Optional[str]]]:
+        """Return stored `(result, error)` pairs keyed by row index."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT row_idx, result, error FROM results WHERE run_id = ? ORDER BY row_idx", (run_id,)
+            ).fetchall()
+        return {int(r["row_idx"]): (ResultRecord.from_dict(json.loads(r["result"])), r["error"]) for r in rows}
+
+    def failed_shards(self, run_id: str) -> List[Dict[str, Any]]:
+        """Return shards that ran out of attempts, with their row range and error."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT shard_id, start_row, payload, error FROM shards WHERE run_id = ? AND status = 'failed'",
+                (run_id,),
+            ).fetchall()
+        return [
+            {"shard_id": r["shard_id"], "start_row": r["start_row"], "rows": len(json.loads(r["payload"])),
+             "error": r["error"]}
+            for r in rows
+        ]
+
+    def shard_metrics(self, run_id: str) -> List[Dict[str, Any]]:
+        """Return the metrics snapshots stored by workers for completed shards."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT metrics FROM shards WHERE run_id = ? AND status = 'done' AND metrics IS NOT NULL", (run_id,)
+            ).fetchall()
+        return [json.loads(r["metrics"]) for r in rows]
+
+    def finish_run(self, run_id: str, result_path: str) -> None:
+        """Record the merged output of a run."""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE runs SET finished_at = ?, result_path = ? WHERE id = ?",
+                         (time.time(), result_path, run_id))
+
+
+def run_worker(
+    queue_path: str,
+    run_id: Optional[str] = None,
+    processes: Optional[int] = None,
+    poll_seconds: float = 5.0,
+    exit_when_idle: bool = False,
+) -> int:
+    """Lease and process shards until stopped (or, with `exit_when_idle`, until none are left).
+
+    Each shard runs on a local process pool through the regular pipeline; the lease is
+    renewed while it runs and the work is abandoned if the lease is lost. Returns the
+    number of shards this worker completed.
+    """
+    from src.orchestrator import iter_results, make_executor
+    from src.utils.metrics import metrics
+
+    queue = WorkQueue(queue_path)
+    owner = worker_id()
+    completed = 0
+    workers = processes or os.cpu_count() or 1
+    logger.info("Worker %s polling %s", owner, queue_path)
+    with make_executor(processes) as ex:
+        while True:
+            shard = queue.lease(owner, run_id=run_id)
+            if shard is None:
+                if exit_when_idle:
+                    break
+                time.sleep(poll_seconds)
+                continue
+            metrics.reset()
+            state = {"renewed": time.monotonic(), "lost": False}
+
+            def lease_lost() -> bool:
+                # Polled about twice a second by iter_results: renew at a third of the lease
+                if time.monotonic() - state["renewed"] >= shard["lease_seconds"] / 3:
+                    state["lost"] = not queue.renew(shard)
+                    state["renewed"] = time.monotonic()
+                return state["lost"]
+
+            rows: List[Tuple[int, ResultRecord, Optional[str]]] = []
+            try:
+                for idx, result, error in iter_results(
+                    shard["comments"], ex, should_cancel=lease_lost, max_inflight=workers * 4
+                ):
+                    rows.append((shard["start_row"] + idx, result, error))
+            except BaseException:
+                queue.release(shard)
+                raise
+            if state["lost"] or not queue.complete(shard, rows, metrics.snapshot()):
+                logger.warning("Lost lease on shard %s/%s; results discarded", shard["run_id"], shard["shard_id"])
+                continue
+            completed += 1
+            logger.info("Shard %s/%s done (%s rows)", shard["run_id"], shard["shard_id"], len(rows))
+    return completed
+
+
+def coordinate(
+    input_path: str,
+    output_path: str,
+    text_column: str,
+    queue_path: str,
+    shard_size: int = 200,
+    lease_seconds: float = 300.0,
+    max_attempts: int = 3,
+    run_id: Optional[str] = None,
+    poll_seconds: float = 5.0,
+) -> Tuple[int, str]:
+    """Shard a docket into the queue, wait for workers to finish it and merge the results.
+
+    Pass `run_id` to re-attach to an existing run (e.g. after the coordinator restarted)
+    instead of enqueueing the input again. Rows of shards that failed every attempt keep
+    blank results with the reason in `processing_error`. Returns `(row_count, output_path)`.
+    """
+    from tqdm import tqdm
+
+    from src.orchestrator import build_output_frame, empty_result, read_comments, write_output
+    from src.utils.metrics import metrics, write_run_report
+
+    metrics.reset()
+    run_start = time.perf_counter()
+    queue = WorkQueue(queue_path)
+    df, comments = read_comments(input_path, text_column)
+    if run_id is None:
+        run_id = queue.create_run(input_path, output_path, text_column, comments, shard_size, lease_seconds,
+                                  max_attempts)
+        logger.info("Run %s: %s rows in %s shards -> %s", run_id, len(comments),
+                    -(-len(comments) // max(1, shard_size)), queue_path)
+    elif queue.get_run(run_id) is None:
+        raise ValueError(f"Unknown run id: {run_id}")
+
+    with tqdm(total=len(comments), desc=f"Run {run_id}") as bar:
+        while True:
+            prog = queue.progress(run_id)
+            bar.update(prog["rows_done"] - bar.n)
+            if not prog["queued"] and not prog["leased"]:
+                break
+            time.sleep(poll_seconds)
+
+    with metrics.stage("merge"):
+        stored = queue.results(run_id)
+        for snap in queue.shard_metrics(run_id):
+            metrics.merge(snap)
+        for shard in queue.failed_shards(run_id):
+            logger.error("Shard %s (rows %s-%s) failed: %s", shard["shard_id"], shard["start_row"],
+                         shard["start_row"] + shard["rows"] - 1, shard["error"])
+            for idx in range(shard["start_row"], shard["start_row"] + shard["rows"]):
+                stored.setdefault(idx, (empty_result(shard["error"]), shard["error"]))
+        results = [stored[i][0] if i in stored else None for i in range(len(comments))]
+        failed = sum(1 for v in stored.values() if v[1] is not None)
+
+    out_df = build_output_frame(df, results, comments)
+    stamped_output_path = write_output(out_df, output_path)
+    queue.finish_run(run_id, stamped_output_path)
+
+    metrics.inc("rows_total", len(out_df))
+    metrics.inc("rows_failed_total", failed)
+    write_run_report(stamped_output_path, run={
+        "command": "coordinate",
+        "run_id": run_id,
+        "queue": queue_path,
+        "input": input_path,
+        "output": stamped_output_path,
+        "rows": len(out_df),
+        "rows_failed": failed,
+        "wall_seconds": time.perf_counter() - run_start,
+    })
+    return len(out_df), stamped_output_path
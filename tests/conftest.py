@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Make `src` importable when pytest is run from the project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# Tests never read or write the shared on-disk result cache
+os.environ["RESULT_CACHE"] = "0"
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from src.orchestrator import batch_labels, batch_output_path, batch_output_paths, expand_inputs
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+
+
+def test_expand_inputs_skips_outputs_of_earlier_runs(tmp_path):
+    for name in ("week_1.xlsx", "week_2.xlsx", "sub/week_3.xlsx",
+                 "week_1_processed_10182026_1106PM.xlsx", "week_2_processed_2_10182026_1106PM.xlsx",
+                 "all_comments_10182026_1106PM.xlsx",
+                 "all_comments_10182026_1106PM.run_report.json", "~$week_1.xlsx"):
+        _touch(str(tmp_path / name))
+    output = str(tmp_path / "all_comments.xlsx")
+
+    by_glob = expand_inputs(str(tmp_path / "week_*.xlsx"), output_path=output)
+    assert [os.path.basename(p) for p in by_glob] == ["week_1.xlsx", "week_2.xlsx"]
+
+    by_dir = expand_inputs(str(tmp_path), output_path=output)
+    assert [os.path.relpath(p, tmp_path) for p in by_dir] == [
+        os.path.join("sub", "week_3.xlsx"), "week_1.xlsx", "week_2.xlsx",
+    ]
+
+
+def test_expand_inputs_without_matches_raises(tmp_path):
+    with pytest.raises(ValueError):
+        expand_inputs(str(tmp_path / "*.xlsx"))
+
+
+def test_batch_labels_and_output_paths(tmp_path):
+    paths = [str(tmp_path / "a.xlsx"), str(tmp_path / "sub" / "b.xlsx")]
+    labels = batch_labels(paths)
+    assert labels == ["a.xlsx", os.path.join("sub", "b.xlsx")]
+    out = str(tmp_path / "out" / "all.xlsx")
+    assert batch_output_path(out, labels[1]) == str(tmp_path / "out" / "sub_b_processed.xlsx")
+
+
+def test_batch_output_paths_never_collide(tmp_path):
+    for name in ("a.xls", "a.xlsx", "sub/b.xlsx", "sub_b.xlsx", "Sub_B.xlsx"):
+        _touch(str(tmp_path / "in" / name))
+    labels = batch_labels(expand_inputs(str(tmp_path / "in" / "**" / "*.xls*")))
+    out_dir = tmp_path / "out"
+    paths = batch_output_paths(str(out_dir / "all.xlsx"), labels)
+
+    assert len({p.lower() for p in paths}) == len(labels) == 5
+    assert dict(zip(labels, paths)) == {
+        "Sub_B.xlsx": str(out_dir / "Sub_B_processed.xlsx"),
+        "a.xls": str(out_dir / "a_processed.xlsx"),
+        "a.xlsx": str(out_dir / "a_processed_2.xlsx"),
+        os.path.join("sub", "b.xlsx"): str(out_dir / "sub_b_processed_2.xlsx"),
+        "sub_b.xlsx": str(out_dir / "sub_b_processed_3.xlsx"),
+    }
@@ -0,0 +1,80 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import src.orchestrator as orchestrator
+from src.chunking import split_comment
+from src.records import ResultRecord
+from src.utils.metrics import metrics
+
+
+def test_short_comment_is_one_unchanged_chunk():
+    text = "  A short comment.\n\nTwo paragraphs.  "
+    assert split_comment(text, 3000, 200) == [text]
+
+
+def test_long_comment_splits_on_paragraphs_with_overlap():
+    paras = [f"Paragraph {i} " + "word " * 50 for i in range(20)]
+    chunks = split_comment("\n\n".join(paras), max_tokens=200, overlap_tokens=80)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= 200 * 4 + 10
+    # Every paragraph is kept, and consecutive chunks share their boundary paragraph
+    assert all(any(p.strip() in c for c in chunks) for p in paras)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert prev.split("\n\n")[-1] == nxt.split("\n\n")[0]
+
+
+def test_oversized_paragraph_is_split_by_sentence_and_length():
+    text = "x" * 5000 + ". " + "Short sentence."
+    chunks = split_comment(text, max_tokens=100, overlap_tokens=0)
+    assert len(chunks) > 1
+    assert "".join(chunks).count("x") == 5000
+
+
+@pytest.mark.parametrize(
+    "text", [" " * 12010, "\n" * 15000, "\t \n" * 5000], ids=["spaces", "newlines", "mixed"]
+)
+def test_whitespace_only_long_comment_is_one_chunk(text):
+    assert split_comment(text, 3000, 200) == [text]
+
+
+def test_iter_results_yields_whitespace_only_and_duplicate_rows(monkeypatch):
+    calls = []
+
+    def fake_process(comment):
+        calls.append(comment)
+        return ResultRecord(), {}
+
+    monkeypatch.setattr(orchestrator, "_process_single", fake_process)
+    comments = [" " * 12010, "a comment", " " * 12010, "a comment", ""]
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        rows = list(orchestrator.iter_results(comments, ex))
+    assert sorted(idx for idx, _, _ in rows) == [0, 1, 2, 3, 4]
+    assert all(error is None for _, _, error in rows)
+    # Identical texts are sent once
+    assert sorted(calls) == sorted(["", " " * 12010, "a comment"])
+
+
+def test_chunked_row_failure_keeps_metrics_of_every_chunk(monkeypatch):
+    def fake_process(chunk):
+        snap = {"counters": {'llm_calls_total{kind="chat"}': 1, 'llm_prompt_tokens_total{kind="chat"}': 100}}
+        if chunk.startswith("fail"):
+            raise orchestrator._RowError("boom", snap)
+        # Finish after the failed chunk has been handled
+        time.sleep(0.7)
+        return ResultRecord(), snap
+
+    monkeypatch.setattr(orchestrator, "_process_single", fake_process)
+    monkeypatch.setenv("CHUNK_TOKENS", "60")
+    monkeypatch.setenv("CHUNK_OVERLAP_TOKENS", "0")
+    comment = "fail " * 40 + "\n\n" + "ok " * 30
+    metrics.reset()
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        rows = list(orchestrator.iter_results([comment], ex))
+
+    assert [(idx, error) for idx, _, error in rows] == [(0, "boom")]
+    counters = metrics.snapshot()["counters"]
+    assert counters['llm_calls_total{kind="chat"}'] == 2
+    assert counters['llm_prompt_tokens_total{kind="chat"}'] == 200
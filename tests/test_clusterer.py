@@ -0,0 +1,19 @@
+import json
+
+import pandas as pd
+
+from src.comment_theme_clusterer import cluster_themes
+from src.utils.metrics import report_paths
+
+
+def test_no_themes_still_writes_run_report(tmp_path):
+    input_path, output_path = tmp_path / "results.xlsx", tmp_path / "clusters.xlsx"
+    # Failed rows leave the themes cell blank, which reads back as NaN
+    pd.DataFrame({"themes": ["[]", None, "[]"]}).to_excel(input_path, index=False)
+
+    assert cluster_themes(str(input_path), str(output_path), llm_labels=False) == (0, str(output_path))
+    assert pd.read_excel(output_path).empty
+    json_path, csv_path = report_paths(str(output_path))
+    with open(json_path, encoding="utf-8") as f:
+        run = json.load(f)["run"]
+    assert run["command"] == "cluster" and run["clusters"] == 0
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+import src.orchestrator as orchestrator
+from src.jobs import JobRunner, JobStore
+from src.records import ResultRecord, Verdict
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "jobs" / "jobs.sqlite")
+
+
+@pytest.fixture
+def input_path(tmp_path):
+    path = tmp_path / "docket.xlsx"
+    pd.DataFrame({"comment": [f"comment {i}" for i in range(6)]}).to_excel(path, index=False)
+    return str(path)
+
+
+def _interrupted_job(db_path, input_path, output_path):
+    """A job that was running with rows 0-1 stored (row 1 failed) when the app stopped."""
+    store = JobStore(db_path)
+    job_id = store.submit(input_path, output_path, "comment")
+    assert store.claim_next()["status"] == "running"
+    store.record_rows(job_id, [(0, ResultRecord(flags=Verdict.PII), None),
+                               (1, ResultRecord(error="timeout"), "timeout")])
+    return job_id
+
+
+def test_restart_requeues_running_job_and_keeps_its_rows(db_path, input_path, tmp_path):
+    job_id = _interrupted_job(db_path, input_path, str(tmp_path / "out.xlsx"))
+
+    store = JobStore(db_path)
+    assert store.requeue_interrupted() == 1
+    job = store.get(job_id)
+    assert job["status"] == "queued" and job["rows_done"] == 2 and job["rows_failed"] == 1
+    assert sorted(store.done_rows(job_id)) == [0, 1]
+    assert list(store.done_rows(job_id, include_failed=False)) == [0]
+    assert store.claim_next()["rows_at_start"] == 2
+
+
+@pytest.mark.parametrize("status", ["cancelled", "failed"])
+def test_resume_requeues_stopped_job(db_path, input_path, tmp_path, status):
+    store = JobStore(db_path)
+    job_id = store.submit(input_path, str(tmp_path / "out.xlsx"), "comment")
+    store.claim_next()
+    store.finish(job_id, status, error="boom" if status == "failed" else None)
+    store.resume(job_id)
+    job = store.get(job_id)
+    assert job["status"] == "queued" and job["error"] is None and job["finished_at"] is None
+
+
+def test_resume_leaves_done_job_alone(db_path, input_path, tmp_path):
+    store = JobStore(db_path)
+    job_id = store.submit(input_path, str(tmp_path / "out.xlsx"), "comment")
+    store.claim_next()
+    store.finish(job_id, "done")
+    store.resume(job_id)
+    assert store.get(job_id)["status"] == "done"
+
+
+def test_resumed_job_processes_only_missing_and_failed_rows(db_path, input_path, tmp_path, monkeypatch):
+    calls = []
+
+    def fake_process(comment):
+        calls.append(comment)
+        return ResultRecord(), {}
+
+    monkeypatch.setattr(orchestrator, "_process_single", fake_process)
+    job_id = _interrupted_job(db_path, input_path, str(tmp_path / "out.xlsx"))
+
+    store = JobStore(db_path)
+    store.requeue_interrupted()
+    runner = JobRunner(store, max_workers=2)
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        runner._executor = ex
+        runner._run(store.claim_next())
+
+    assert sorted(calls) == [f"comment {i}" for i in range(1, 6)]
+    job = store.get(job_id)
+    assert job["status"] == "done" and job["rows_done"] == 6 and job["rows_failed"] == 0
+    out = pd.read_excel(job["result_path"])
+    assert out["pii_ver"].tolist() == [True] + [False] * 5
+
+
+def test_retry_failed_rows_of_done_job(db_path, input_path, tmp_path, monkeypatch):
+    calls = []
+    failures = {"comment 3": 1}
+
+    def flaky_process(comment):
+        calls.append(comment)
+        if failures.get(comment):
+            failures[comment] -= 1
+            raise orchestrator._RowError("timeout", {})
+        return ResultRecord(), {}
+
+    monkeypatch.setattr(orchestrator, "_process_single", flaky_process)
+    store = JobStore(db_path)
+    job_id = store.submit(input_path, str(tmp_path / "out.xlsx"), "comment")
+    runner = JobRunner(store, max_workers=2)
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        runner._executor = ex
+        runner._run(store.claim_next())
+        job = store.get(job_id)
+        assert job["status"] == "done" and job["rows_failed"] == 1
+
+        calls.clear()
+        store.resume(job_id)
+        assert store.get(job_id)["status"] == "queued"
+        runner._run(store.claim_next())
+
+    assert calls == ["comment 3"]
+    job = store.get(job_id)
+    assert job["status"] == "done" and job["rows_done"] == 6 and job["rows_failed"] == 0
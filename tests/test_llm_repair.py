@@ -0,0 +1,57 @@
+import pytest
+
+from src.llm.azure_openai_client import _check, _close_truncated, _repair_locally
+from src.llm.schemas import TASK_ONE_SCHEMA, TASK_TWO_SCHEMA, conform, validate
+
+
+def test_repair_strips_code_fences_and_chatter():
+    text = 'Here you go:\n```json\n{"overall_opinion": "oppose", "themes": ["cost"]}\n```'
+    assert _repair_locally(text) == {"overall_opinion": "oppose", "themes": ["cost"]}
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"themes": ["cost", "acc', {"themes": ["cost", "acc"]}),
+        ('{"themes": ["cost",', {"themes": ["cost"]}),
+        ('{"overall_opinion": "oppose", "themes":', {"overall_opinion": "oppose"}),
+        ('```json\n{"a": {"b": [1, 2', {"a": {"b": [1, 2]}}),
+    ],
+    ids=["open-string", "trailing-comma", "dangling-key", "fenced-nested"],
+)
+def test_repair_closes_truncated_output(text, expected):
+    assert _repair_locally(text) == expected
+
+
+def test_close_truncated_ignores_brackets_inside_strings():
+    assert _close_truncated('{"q": "a [b {c') == '{"q": "a [b {c"}'
+
+
+def test_repair_accepts_python_literals():
+    assert _repair_locally("{'pii_ver': 'True', 'pii_txt': [],}") == {"pii_ver": "True", "pii_txt": []}
+
+
+def test_repair_rejects_text_without_json():
+    with pytest.raises(ValueError):
+        _repair_locally("I cannot help with that.")
+
+
+def test_conform_fixes_case_booleans_and_bare_strings():
+    value = {
+        "pii_ver": True, "pii_txt": "my SSN is 123",
+        "third_pty_info_ver": "false", "third_pty_info_txt": None,
+        "ssa_employee_ver": "FALSE", "ssa_employee_txt": [],
+        "offensive_lang_ver": "False", "offensive_lang_txt": "  ",
+    }
+    fixed = conform(value, TASK_ONE_SCHEMA)
+    assert fixed["pii_ver"] == "True" and fixed["pii_txt"] == ["my SSN is 123"]
+    assert fixed["third_pty_info_ver"] == "False" and fixed["third_pty_info_txt"] == []
+    assert fixed["offensive_lang_txt"] == []
+    assert validate(fixed, TASK_ONE_SCHEMA) == []
+
+
+def test_check_reports_truncated_response_missing_fields():
+    repaired = _repair_locally('{"overall_opinion": "Oppose", "themes": ["cost"')
+    assert _check(repaired, TASK_TWO_SCHEMA) == []
+    errors = _check(_repair_locally('{"overall_opinion": "Oppose"'), TASK_TWO_SCHEMA)
+    assert any("themes" in e for e in errors)
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import src.quote_spans as quote_spans
+from src.quote_spans import locate_quotes, normalize_quote, redact
+from src.records import ResultRecord, Verdict
+
+
+@pytest.fixture(params=["find", "automaton"])
+def matcher(request, monkeypatch):
+    if request.param == "automaton":
+        pytest.importorskip("ahocorasick")
+        monkeypatch.setattr(quote_spans, "AUTOMATON_MIN_QUOTES", 1)
+    return request.param
+
+
+def _record(pii=(), third=(), offensive=()):
+    return ResultRecord(Verdict.PII, quotes=(tuple(pii), tuple(third), (), tuple(offensive)))
+
+
+def _spans(cols, row=0):
+    return [(s["category"], s["start"], s["end"]) for s in json.loads(cols["quote_spans"][row])]
+
+
+def test_offsets_map_back_through_collapsed_whitespace(matcher):
+    text = "  Hello,  my SSN is\n\n  123-45-6789.\tCall   me."
+    cols = locate_quotes([text], [_record(pii=["my ssn IS 123-45-6789"], third=["CALL ME"])])
+    spans = _spans(cols)
+    assert [text[s:e] for _, s, e in spans] == ["my SSN is\n\n  123-45-6789", "Call   me"]
+    assert cols["redacted_comment"][0] == "  Hello,  [REDACTED].\t[REDACTED]."
+    assert json.loads(cols["unmatched_quotes"][0]) == []
+
+
+def test_unicode_whitespace_and_case(matcher):
+    # No-break space, em space and a line separator are whitespace; "\u0130" lowers to two code points
+    text = "\u0130stanbul office:\u00a0\u2003Jane\u2028DOE wrote"
+    cols = locate_quotes([text], [_record(pii=["jane doe"], offensive=["office: jane"])])
+    assert sorted(text[s:e] for _, s, e in _spans(cols)) == [
+        "Jane\u2028DOE", "office:\u00a0\u2003Jane",
+    ]
+    assert normalize_quote("  Jane\u00a0 DOE ") == "jane doe"
+
+
+def test_every_occurrence_and_overlapping_spans_are_redacted(matcher):
+    text = "my son and MY SON again"
+    cols = locate_quotes([text], [_record(third=["my son", "son and my"])])
+    assert sorted(_spans(cols)) == [("third_pty_info", 0, 6), ("third_pty_info", 3, 13),
+                                    ("third_pty_info", 11, 17)]
+    assert cols["redacted_comment"][0] == "[REDACTED] again"
+
+
+def test_unmatched_quotes_and_rows_without_results(matcher):
+    cols = locate_quotes(["a real comment", "other"], [_record(pii=["not in the text"]), None])
+    assert _spans(cols) == []
+    assert json.loads(cols["unmatched_quotes"][0]) == [{"category": "pii", "quote": "not in the text"}]
+    assert cols["redacted_comment"][0] == "a real comment"
+    assert cols["quote_spans"][1] is None and cols["redacted_comment"][1] is None
+
+
+def test_redact_merges_adjacent_spans():
+    assert redact("abcdef", [(3, 5), (0, 2), (1, 3)]) == "[REDACTED]f"
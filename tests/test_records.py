@@ -0,0 +1,59 @@
+import json
+import pickle
+
+import pytest
+
+from src.records import Opinion, ResultRecord, Verdict, output_columns
+
+
+def test_output_columns_leave_failed_rows_blank():
+    ok = ResultRecord(flags=Verdict.PII, opinion=2, quotes=(("ssn",), (), (), ()), themes=("cost",))
+    failed = ResultRecord(error="invalid JSON from model")
+    cols = output_columns([ok, failed, None])
+
+    assert cols["pii_ver"] == ["True", None, None]
+    assert cols["third_pty_info_ver"] == ["False", None, None]
+    assert cols["overall_opinion"] == ["oppose", None, None]
+    assert cols["pii_txt"] == ['["ssn"]', None, None]
+    assert cols["themes"] == ['["cost"]', None, None]
+    assert cols["processing_error"] == [None, "invalid JSON from model", None]
+
+
+RECORDS = [
+    ResultRecord(),
+    ResultRecord(
+        flags=Verdict.PII | Verdict.OFFENSIVE_LANG,
+        opinion=1,
+        quotes=(("my SSN", "123-45-6789"), (), (), ("idiots",)),
+        themes=("cost", "wait times"),
+    ),
+    ResultRecord(error="timeout"),
+]
+
+
+@pytest.mark.parametrize("record", RECORDS, ids=["empty", "full", "failed"])
+def test_pickle_round_trip(record):
+    restored = pickle.loads(pickle.dumps(record))
+    assert restored == record
+    assert restored.__reduce__()[1] == (record.flags, record.opinion, record.quotes, record.themes, record.error)
+
+
+@pytest.mark.parametrize("record", RECORDS, ids=["empty", "full", "failed"])
+def test_dict_round_trip(record):
+    d = record.to_dict()
+    assert ResultRecord.from_dict(d) == record
+    assert ResultRecord.from_dict(json.loads(json.dumps(d))) == record
+
+
+def test_from_dict_of_task_output():
+    d = {
+        "pii_ver": "True", "pii_txt": ["my SSN"],
+        "third_pty_info_ver": "False", "third_pty_info_txt": [],
+        "overall_opinion": "oppose", "themes": ["cost"],
+    }
+    record = ResultRecord.from_dict(d)
+    assert record.flags == Verdict.PII
+    assert record.opinion == Opinion.OPPOSE
+    assert record.quotes == (("my SSN",), (), (), ())
+    assert record.error is None
+    assert record.to_dict()["ssa_employee_ver"] == "False"
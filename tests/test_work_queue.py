@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from src.records import ResultRecord, Verdict
+from src.work_queue import WorkQueue
+
+COMMENTS = [f"comment {i}" for i in range(5)]
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return WorkQueue(str(tmp_path / "queue.sqlite"))
+
+
+def _rows(shard):
+    return [(shard["start_row"] + i, ResultRecord(flags=Verdict.PII), None) for i in range(len(shard["comments"]))]
+
+
+def _expire(shard):
+    time.sleep(shard["lease_seconds"] + 0.05)
+
+
+def test_every_row_completed_exactly_once(queue):
+    run_id = queue.create_run("in.xlsx", "out.xlsx", "comment", COMMENTS, shard_size=2)
+    shards = []
+    while (shard := queue.lease("w1", run_id)) is not None:
+        shards.append(shard)
+    assert [s["comments"] for s in shards] == [COMMENTS[0:2], COMMENTS[2:4], COMMENTS[4:5]]
+
+    assert all(queue.complete(s, _rows(s)) for s in shards)
+    # A second completion with the same lease is rejected and writes nothing
+    assert not queue.complete(shards[0], _rows(shards[0]))
+    assert sorted(queue.results(run_id)) == list(range(len(COMMENTS)))
+    assert queue.progress(run_id) == {"queued": 0, "leased": 0, "done": 3, "failed": 0, "rows_done": 5}
+
+
+def test_expired_lease_is_handed_out_again_and_stale_holder_loses(queue):
+    run_id = queue.create_run("in.xlsx", "out.xlsx", "comment", COMMENTS[:2], shard_size=2, lease_seconds=0.1)
+    slow = queue.lease("slow", run_id)
+    assert queue.lease("fast", run_id) is None
+    _expire(slow)
+
+    fast = queue.lease("fast", run_id)
+    assert fast["shard_id"] == slow["shard_id"] and fast["lease_token"] != slow["lease_token"]
+    assert not queue.renew(slow)
+    assert queue.complete(fast, _rows(fast))
+    assert not queue.complete(slow, _rows(slow))
+    assert len(queue.results(run_id)) == 2
+
+
+def test_shard_fails_after_max_attempts(queue):
+    run_id = queue.create_run(
+        "in.xlsx", "out.xlsx", "comment", COMMENTS[:1], lease_seconds=0.1, max_attempts=2
+    )
+    for _ in range(2):
+        _expire(queue.lease("crashy", run_id))
+    assert queue.lease("crashy", run_id) is None
+    assert queue.progress(run_id)["failed"] == 1
+    [failed] = queue.failed_shards(run_id)
+    assert failed["rows"] == 1 and "expired 2 times" in failed["error"]
+
+
+def test_release_returns_shard_without_using_an_attempt(queue):
+    run_id = queue.create_run("in.xlsx", "out.xlsx", "comment", COMMENTS[:1], lease_seconds=0.1, max_attempts=1)
+    shard = queue.lease("w1", run_id)
+    queue.release(shard)
+    again = queue.lease("w2", run_id)
+    assert again is not None and again["shard_id"] == shard["shard_id"]
+    _expire(again)
+    assert queue.lease("w3", run_id) is None
+    assert "expired 1 times" in queue.failed_shards(run_id)[0]["error"]